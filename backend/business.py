@@ -1,10 +1,17 @@
 # backend/business.py
 
 import os
-import time
+import logging
 import random
 import json
-import requests
+import re
+import orjson
+import asyncio
+import gzip
+import hashlib
+import time
+from collections import OrderedDict
+import httpx
 from dotenv import load_dotenv
 from fastapi import HTTPException
 
@@ -18,53 +25,143 @@ SUMMARY_MODEL  = "llama-3.1-8b-instant"  # for human-readable summary
 if not API_KEY:
     raise ValueError("GROQ_API_KEY must be set in the environment")
 
-# ─── Helper: call Groq with retry/backoff ──────────────────────────────────────
-def _call_groq_with_retries(payload: dict, max_retries: int = 5, backoff: float = 1.0) -> dict:
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 502, 503, 504}
+MAX_BACKOFF    = 30.0  # seconds; cap for the exponential backoff window
+
+# Request-body gzip is opt-in: responses are always compressed, but Groq does not
+# document accepting Content-Encoding on requests
+GZIP_REQUESTS  = os.getenv("GROQ_GZIP_REQUESTS", "").lower() in ("1", "true", "yes")
+GZIP_MIN_BYTES = 1024
+
+# ─── Shared async client (lets endpoints await Groq without blocking a worker) ─
+_ACLIENT = httpx.AsyncClient(
+    http2=True,
+    timeout=30,
+    headers={
+        "Authorization": f"Bearer {API_KEY}",
+        "Content-Type": "application/json",
+        "Accept-Encoding": "gzip, deflate",
+    },
+    limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+)
+
+# ─── Helper: serialize (and optionally gzip) a request body ───────────────────
+def _encode_body(payload: dict):
+    body = orjson.dumps(payload)
+    if GZIP_REQUESTS and len(body) > GZIP_MIN_BYTES:
+        return gzip.compress(body), {"Content-Encoding": "gzip"}
+    return body, {}
+
+# ─── Helper: how long to wait before retrying a throttled/unavailable call ────
+def _retry_wait(resp, attempt: int, backoff: float) -> float:
+    """
+    Honour Groq's Retry-After header when present; otherwise use full-jitter
+    exponential backoff capped at MAX_BACKOFF. A Retry-After above MAX_BACKOFF
+    (e.g. a daily token limit) is returned as-is; the caller fails fast on it.
+    """
+    retry_after = resp.headers.get("Retry-After")
+    if retry_after:
+        try:
+            wait = float(retry_after)
+        except ValueError:
+            wait = None
+        if wait is not None:
+            return wait
+    return min(MAX_BACKOFF, backoff * (2 ** attempt)) * random.random()
+
+# ─── Helper: in-memory LRU of validated results for identical Groq payloads ──
+# Callers store only output that parsed and validated, so a bad reply is never re-served.
+_CACHE_SIZE = 1024
+_CACHE_TTL = 60 * 60  # seconds
+_RESULT_CACHE: "OrderedDict[str, tuple]" = OrderedDict()
+
+def _payload_key(payload: dict) -> str:
+    return hashlib.blake2b(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+def _cache_get(key: str):
+    entry = _RESULT_CACHE.get(key)
+    if entry is None:
+        return None
+    expires, value = entry
+    if expires < time.monotonic():
+        del _RESULT_CACHE[key]
+        return None
+    _RESULT_CACHE.move_to_end(key)
+    return value
+
+def _cache_put(key: str, value) -> None:
+    _RESULT_CACHE[key] = (time.monotonic() + _CACHE_TTL, value)
+    _RESULT_CACHE.move_to_end(key)
+    if len(_RESULT_CACHE) > _CACHE_SIZE:
+        _RESULT_CACHE.popitem(last=False)
+
+async def _acall_groq_with_retries(
+    payload: dict, max_retries: int = 5, backoff: float = 1.0
+) -> dict:
+    body, headers = _encode_body(payload)
     for attempt in range(max_retries):
-        resp = requests.post(
-            ENDPOINT,
-            json=payload,
-            headers={
-                "Authorization": f"Bearer {API_KEY}",
-                "Content-Type": "application/json",
-            },
-            timeout=30,
-        )
+        resp = await _ACLIENT.post(ENDPOINT, content=body, headers=headers)
         if resp.status_code == 200:
-            return resp.json()
-        if resp.status_code == 429:
-            wait = backoff * (2 ** attempt) + random.random()
-            time.sleep(wait)
+            return orjson.loads(resp.content)
+        if resp.status_code in RETRY_STATUSES:
+            if attempt == max_retries - 1:
+                break
+            wait = _retry_wait(resp, attempt, backoff)
+            if wait > MAX_BACKOFF:
+                logger.error("Groq returned %d with Retry-After %.0fs; not waiting", resp.status_code, wait)
+                raise HTTPException(
+                    503,
+                    f"Groq rate limited: retry after {wait:.0f}s",
+                    headers={"Retry-After": str(int(wait))},
+                )
+            logger.warning("Groq returned %d; retrying in %.2fs", resp.status_code, wait)
+            await asyncio.sleep(wait)
             continue
         resp.raise_for_status()
-    raise HTTPException(500, f"Rate limit: exceeded {max_retries} retries")
+    raise HTTPException(500, f"Groq unavailable: exceeded {max_retries} retries")
 
 # ─── Helper: extract the first {...} JSON block from LLM output ───────────────
+_DECODER = json.JSONDecoder()
+_FENCE_RE = re.compile(r"^```(?:\w+)?\n?|\n?```$")
+
 def _extract_json(raw: str) -> dict:
-    txt = raw.strip()
-    # strip markdown fences if present
-    if txt.startswith("```"):
-        txt = "\n".join(txt.split("\n")[1:])
-    if txt.endswith("```"):
-        txt = "\n".join(txt.split("\n")[:-1])
+    # strip markdown fences (```json ... ```) if present
+    txt = _FENCE_RE.sub("", raw.strip())
 
     start = txt.find("{")
     if start == -1:
         raise ValueError("No JSON object found in LLM output")
 
-    depth = 0
-    for i, ch in enumerate(txt[start:], start):
-        if ch == "{":
-            depth += 1
-        elif ch == "}":
-            depth -= 1
-            if depth == 0:
-                snippet = txt[start : i + 1]
-                return json.loads(snippet)
-    raise ValueError("Unmatched braces in LLM output")
+    # raw_decode parses one object starting at `start` and ignores trailing prose
+    obj, _ = _DECODER.raw_decode(txt, start)
+    return obj
+
+# ─── Static system prompts (built once, shared by every request) ──────────────
+_BIZ_SYSTEM = {
+    "role": "system",
+    "content": (
+        "You are a business analyst. "
+        "Output MUST be raw JSON only, with no explanations. "
+        "Produce exactly one JSON object with keys: "
+        "name, founded, locations, offerings, price_range, "
+        "audience, usp, competitors, channels, goals, voice. "
+        "All values must be strings or lists of strings."
+    ),
+}
+
+_SUMMARY_SYSTEM = {
+    "role": "system",
+    "content": (
+        "You are a business analyst. "
+        "Summarize the following BUSINESS PROFILE JSON into one concise paragraph, "
+        "preserving all key details and keywords."
+    ),
+}
 
 # ─── Main: build structured Business Profile JSON ─────────────────────────────
-def summarize_business(biz: dict) -> dict:
+async def summarize_business(biz: dict, use_cache: bool = True) -> dict:
     """
     Input:  biz = {
       name, founded, locations, offerings, price_range,
@@ -72,62 +169,49 @@ def summarize_business(biz: dict) -> dict:
     }
     Output: a JSON dict with exactly those keys (values as strings or lists).
     """
-    messages = [
-        {
-            "role": "system",
-            "content": (
-                "You are a business analyst. "
-                "Output MUST be raw JSON only, with no explanations. "
-                "Produce exactly one JSON object with keys: "
-                "name, founded, locations, offerings, price_range, "
-                "audience, usp, competitors, channels, goals, voice. "
-                "All values must be strings or lists of strings."
-            ),
-        },
-        {
-            "role": "user",
-            "content": json.dumps(biz, ensure_ascii=False),
-        },
-    ]
+    messages = [_BIZ_SYSTEM, {"role": "user", "content": orjson.dumps(biz).decode()}]
     payload = {
         "model": BUSINESS_MODEL,
         "messages": messages,
         "max_tokens": 512,
+        "response_format": {"type": "json_object"},
     }
-    data = _call_groq_with_retries(payload)
+    key = _payload_key(payload)
+    if use_cache and (cached := _cache_get(key)) is not None:
+        return cached
+    data = await _acall_groq_with_retries(payload)
     raw = data["choices"][0]["message"]["content"]
     try:
-        return _extract_json(raw)
+        try:
+            profile = orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            # JSON mode should make this unreachable; keep the lenient parser as a safety net
+            profile = _extract_json(raw)
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Failed to parse business profile JSON: {e}\nRaw output:\n{raw}",
         )
+    _cache_put(key, profile)
+    return profile
 
 # ─── Secondary: turn structured profile into a paragraph ──────────────────────
-def summarize_profile(profile: dict) -> str:
+async def summarize_profile(profile: dict, use_cache: bool = True) -> str:
     """
     Input:  profile = the dict returned by summarize_business()
     Output: A concise, human-friendly paragraph preserving all key details.
     """
-    messages = [
-        {
-            "role": "system",
-            "content": (
-                "You are a business analyst. "
-                "Summarize the following BUSINESS PROFILE JSON into one concise paragraph, "
-                "preserving all key details and keywords."
-            ),
-        },
-        {
-            "role": "user",
-            "content": json.dumps(profile, ensure_ascii=False),
-        },
-    ]
+    messages = [_SUMMARY_SYSTEM, {"role": "user", "content": orjson.dumps(profile).decode()}]
     payload = {
         "model": SUMMARY_MODEL,
         "messages": messages,
         "max_tokens": 200,
     }
-    data = _call_groq_with_retries(payload)
-    return data["choices"][0]["message"]["content"].strip()
+    key = _payload_key(payload)
+    if use_cache and (cached := _cache_get(key)) is not None:
+        return cached
+    data = await _acall_groq_with_retries(payload)
+    summary = data["choices"][0]["message"]["content"].strip()
+    if summary:
+        _cache_put(key, summary)
+    return summary
@@ -4,12 +4,23 @@ import logging
 from typing import Any, Dict, List
 
 import numpy as np
-import hdbscan
+
+# Prefer the Numba-JIT implementation; fall back to the reference library
+try:
+    import fast_hdbscan as hdbscan
+    FAST_HDBSCAN = True
+except ImportError:
+    import hdbscan
+    FAST_HDBSCAN = False
 
 # Configure module‐level logger
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# Above this many points, project to a few dimensions before HDBSCAN
+UMAP_THRESHOLD = 500
+UMAP_COMPONENTS = 5
+
 def cluster_embeddings(
     triples: List[Dict[str, Any]],
     min_cluster_fraction: float = 0.05,
@@ -21,7 +32,7 @@ def cluster_embeddings(
     Args:
         triples: List of dicts, each containing:
             - "id": unique identifier
-            - "vector": List[float] embedding
+            - "vector": float32 embedding (np.ndarray or List[float])
             - "payload": original profile dict
         min_cluster_fraction: Minimum fraction of total points for a valid cluster
                               (e.g. 0.05 means clusters must have ≥5% of all points).
@@ -38,7 +49,7 @@ def cluster_embeddings(
 
     # 1) Build embeddings matrix
     try:
-        vectors = np.vstack([t["vector"] for t in triples]).astype(float)
+        vectors = np.stack([t["vector"] for t in triples]).astype(np.float32, copy=False)
     except KeyError as e:
         logger.error("Missing 'vector' key in triples: %s", e)
         raise
@@ -49,33 +60,54 @@ def cluster_embeddings(
     if vectors.ndim != 2:
         raise ValueError(f"Expected 2D array of embeddings, got shape {vectors.shape}")
 
-    # 2) Compute dynamic minimum cluster size
+    # 2) Reduce dimensionality for large inputs (HDBSCAN scales poorly in 384-d)
+    if n > UMAP_THRESHOLD:
+        import umap  # heavy import, only needed for large inputs
+        logger.info("Reducing %d vectors to %d dims with UMAP", n, UMAP_COMPONENTS)
+        vectors = umap.UMAP(
+            n_components=UMAP_COMPONENTS,
+            metric="cosine",
+            n_neighbors=15,
+            random_state=42,
+        ).fit_transform(vectors).astype(np.float32, copy=False)
+
+    # 3) Compute dynamic minimum cluster size
     min_cluster_size = max(2, int(n * min_cluster_fraction))
     logger.info(
         "Clustering %d points with min_cluster_size=%d (%.1f%% of data)",
         n, min_cluster_size, min_cluster_fraction * 100
     )
 
-    # 3) Run HDBSCAN
+    # 4) Run HDBSCAN (fast_hdbscan is Euclidean-only and takes no `metric`)
     try:
-        clusterer = hdbscan.HDBSCAN(
-            min_cluster_size=min_cluster_size,
-            cluster_selection_epsilon=cluster_selection_epsilon,
-            metric="euclidean"
-        )
+        params: Dict[str, Any] = {
+            "min_cluster_size": min_cluster_size,
+            "cluster_selection_epsilon": cluster_selection_epsilon,
+        }
+        if not FAST_HDBSCAN:
+            params["metric"] = "euclidean"
+        clusterer = hdbscan.HDBSCAN(**params)
         labels = clusterer.fit_predict(vectors)
     except Exception as e:
         logger.error("HDBSCAN clustering failed: %s", e)
         raise
 
-    # 4) Assemble clusters
-    clusters: Dict[int, List[Dict[str, Any]]] = {}
-    for triple, lbl in zip(triples, labels):
-        if lbl == -1:  # skip noise
-            continue
-        clusters.setdefault(lbl, []).append(triple["payload"])
+    # 5) Assemble clusters: stable-sort by label, drop noise (-1), slice groups
+    labels = np.asarray(labels)
+    payloads = np.empty(n, dtype=object)
+    payloads[:] = [t["payload"] for t in triples]
+    order = np.argsort(labels, kind="stable")
+    labels_s, payloads_s = labels[order], payloads[order]
+    keep = labels_s != -1
+    labels_s, payloads_s = labels_s[keep], payloads_s[keep]
+    bounds = np.concatenate(([0], np.flatnonzero(np.diff(labels_s)) + 1, [len(labels_s)]))
+    clusters: Dict[int, List[Dict[str, Any]]] = {
+        int(labels_s[start]): payloads_s[start:end].tolist()
+        for start, end in zip(bounds[:-1], bounds[1:])
+        if end > start
+    }
 
-    # 5) Log summary: number of clusters and their sizes
+    # 6) Log summary: number of clusters and their sizes
     num_clusters = len(clusters)
     sizes = {label: len(members) for label, members in clusters.items()}
     logger.info("cluster_embeddings: found %d clusters", num_clusters)
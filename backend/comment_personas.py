@@ -19,6 +19,8 @@ async def comment_personas(request: Dict[str, List[str]]) -> Dict[str, Any]:
     idx = 0
     for question, comments in request.items():
         for c in comments:
+            if not c or not c.strip():  # empty comments give degenerate embeddings
+                continue
             profiles.append({
                 "customer_id": idx,
                 "text": c,
@@ -30,7 +32,7 @@ async def comment_personas(request: Dict[str, List[str]]) -> Dict[str, Any]:
         raise HTTPException(status_code=400, detail="No comments provided")
 
     # 2) Embed all profiles
-    triples = upsert_embeddings(profiles)
+    triples = await upsert_embeddings(profiles)
 
     # 3) Group by source_question instead of clustering
     grouped: Dict[str, List[Dict[str, Any]]] = {}
@@ -44,5 +46,5 @@ async def comment_personas(request: Dict[str, List[str]]) -> Dict[str, Any]:
     }
 
     # 5) Generate one persona per question
-    personas = generate_personas(clusters)
+    personas = await generate_personas(clusters)
     return {"personas": personas}
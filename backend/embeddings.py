@@ -1,107 +1,163 @@
 # backend/embeddings.py
 
 import os
+import asyncio
 import logging
+from functools import lru_cache
 from typing import Any, Dict, List
 
+import numpy as np
 from dotenv import load_dotenv
-from langchain_huggingface import HuggingFaceEmbeddings
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import (
+    Distance,
+    HnswConfigDiff,
+    PointStruct,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    VectorParams,
+)
 from qdrant_client.http.exceptions import UnexpectedResponse, ResponseHandlingException
 
+from .embeddings_model import get_embedder
+
 # ─── Load env & configure logging ─────────────────────────────────────────────
 load_dotenv()
-HF_TOKEN        = os.getenv("HF_TOKEN")
 QDRANT_URL      = os.getenv("QDRANT_URL")
 QDRANT_API_KEY  = os.getenv("QDRANT_API_KEY")
 
-if not HF_TOKEN:
-    raise ValueError("HF_TOKEN is not set in the environment")
 if not QDRANT_URL:
     raise ValueError("QDRANT_URL is not set in the environment")
 if not QDRANT_API_KEY:
     raise ValueError("QDRANT_API_KEY is not set in the environment")
 
-# Export Hugging Face token for the embedder
-os.environ["HUGGINGFACEHUB_API_TOKEN"] = HF_TOKEN
-
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+UPSERT_BATCH_SIZE = 256
 
-# ─── Initialize the HF embedding client ──────────────────────────────────────
-EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
-embedder = HuggingFaceEmbeddings(model_name=EMBED_MODEL)
-logger.info("Loaded HuggingFaceEmbeddings model '%s'", EMBED_MODEL)
 
-
-def get_qdrant_client() -> QdrantClient:
+@lru_cache(maxsize=1)
+def get_qdrant_client() -> AsyncQdrantClient:
     """
-    Instantiate a QdrantClient for Cloud (REST).
+    Return the shared AsyncQdrantClient for Cloud (REST), created on first use.
     """
-    return QdrantClient(
+    return AsyncQdrantClient(
         url=QDRANT_URL,
         api_key=QDRANT_API_KEY,
         prefer_grpc=False
     )
 
 
-def ensure_profiles_collection(client: QdrantClient) -> None:
+async def ensure_profiles_collection(client: AsyncQdrantClient) -> None:
     """
     Create 'profiles' collection if missing.
     """
     try:
-        existing = [c.name for c in client.get_collections().collections]
+        existing = [c.name for c in (await client.get_collections()).collections]
     except (UnexpectedResponse, ResponseHandlingException) as e:
         logger.error("Could not list Qdrant collections: %s", e)
         raise RuntimeError("Cannot contact Qdrant at startup") from e
 
     if "profiles" not in existing:
-        client.create_collection(
+        await client.create_collection(
             collection_name="profiles",
             vectors_config=VectorParams(size=384, distance=Distance.COSINE),
+            hnsw_config=HnswConfigDiff(m=16, ef_construct=100),
+            quantization_config=ScalarQuantization(
+                scalar=ScalarQuantizationConfig(
+                    type=ScalarType.INT8,
+                    quantile=0.99,
+                    always_ram=True,
+                )
+            ),
         )
         logger.info("Created Qdrant collection 'profiles' in the cloud.")
 
 
-def upsert_embeddings(profiles: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def _encode(texts: List[str]) -> np.ndarray:
+    """
+    L2-normalized embeddings as one contiguous float32 matrix (FP16 GPU output is
+    upcast here). Blocking: call via asyncio.to_thread.
+    """
+    import torch
+
+    model = get_embedder()
+    with torch.inference_mode():
+        vectors = model.encode(
+            texts,
+            batch_size=256 if model.device.type == "cuda" else 64,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False,
+        )
+    return np.ascontiguousarray(vectors, dtype=np.float32)
+
+
+async def upsert_embeddings(profiles: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
     1) Serialize each profile (excluding 'customer_id') to text.
-    2) Get embeddings via HF Inference.
+    2) Batch-encode embeddings locally (L2-normalized), once per distinct text.
     3) Lazily init Qdrant & ensure 'profiles' collection exists.
-    4) Upsert to Qdrant.
+    4) Upsert to Qdrant in concurrent batches.
     5) Return triples for clustering.
     """
-    # Build texts & IDs
-    texts = [
-        " | ".join(f"{k}: {v}" for k, v in p.items() if k != "customer_id")
-        for p in profiles
-    ]
-    ids = [p["customer_id"] for p in profiles]
+    if not profiles:
+        logger.warning("No profiles to upsert.")
+        return []
 
-    # Compute embeddings
-    vectors = embedder.embed_documents(texts)
+    # Build texts & IDs. When every row has the same keys in the same order (the CSV
+    # case), resolve them once; otherwise serialize each row from its own keys.
+    shape = tuple(profiles[0])
+    if all(tuple(p) == shape for p in profiles):
+        keys = [k for k in shape if k != "customer_id"]
+        texts = [" | ".join([f"{k}: {p[k]}" for k in keys]) for p in profiles]
+    else:
+        texts = [
+            " | ".join([f"{k}: {v}" for k, v in p.items() if k != "customer_id"])
+            for p in profiles
+        ]
+    ids = [p["customer_id"] for p in profiles]
 
-    # Pack points & triples
-    points: List[Dict[str, Any]] = []
+    # Collapse duplicates (e.g. repeated YouTube comments); the model is uncased,
+    # so case/whitespace variants embed identically
+    unique: Dict[str, int] = {}
+    unique_texts: List[str] = []
+    back: List[int] = []
+    for text in texts:
+        key = text.strip().lower()
+        idx = unique.setdefault(key, len(unique))
+        if idx == len(unique_texts):
+            unique_texts.append(text)
+        back.append(idx)
+    if len(unique_texts) < len(texts):
+        logger.info("Embedding %d unique texts for %d profiles", len(unique_texts), len(texts))
+
+    # Compute embeddings off the event loop so other requests (and job polls) keep flowing
+    vectors = (await asyncio.to_thread(_encode, unique_texts))[back]
+
+    # Pack points & triples (Qdrant needs plain lists; clustering keeps NumPy rows)
+    points: List[PointStruct] = []
     triples: List[Dict[str, Any]] = []
     for pid, vec, payload in zip(ids, vectors, profiles):
-        point = {"id": pid, "vector": vec, "payload": payload}
-        points.append(point)
-        triples.append(point.copy())
-
-    if not points:
-        logger.warning("No profiles to upsert.")
-        return []
+        points.append(PointStruct(id=pid, vector=vec.tolist(), payload=payload))
+        triples.append({"id": pid, "vector": vec, "payload": payload})
 
     # Connect & ensure collection
     client = get_qdrant_client()
-    ensure_profiles_collection(client)
+    await ensure_profiles_collection(client)
 
     # Upsert
     try:
-        client.upsert(collection_name="profiles", points=points)
+        await asyncio.gather(*[
+            client.upsert(
+                collection_name="profiles",
+                points=points[i : i + UPSERT_BATCH_SIZE],
+                wait=False,
+            )
+            for i in range(0, len(points), UPSERT_BATCH_SIZE)
+        ])
         logger.info("Upserted %d embeddings to Qdrant Cloud 'profiles'.", len(points))
     except Exception as e:
         logger.error("Failed to upsert to Qdrant: %s", e)
@@ -0,0 +1,46 @@
+# backend/embeddings_model.py
+
+import os
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# ─── Shared MiniLM SentenceTransformer (one copy per process) ────────────────
+EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+_embedder = None
+_lock = threading.Lock()
+
+
+def get_embedder():
+    """
+    Return the process-wide SentenceTransformer, loading it on first call.
+    On GPU the weights are cast to FP16 so the transformer matmuls run on
+    tensor cores; CPU stays FP32 with torch pinned to half the cores so it
+    does not oversubscribe alongside the event loop and worker threads.
+    """
+    global _embedder
+    if _embedder is None:
+        with _lock:
+            if _embedder is None:
+                import torch
+                from sentence_transformers import SentenceTransformer
+
+                device = "cuda" if torch.cuda.is_available() else "cpu"
+                if device == "cpu":
+                    torch.set_num_threads(max(1, (os.cpu_count() or 2) // 2))
+                model = SentenceTransformer(EMBED_MODEL, device=device)
+                if device == "cuda":
+                    model.half()
+                logger.info("Loaded SentenceTransformer model '%s' on %s", EMBED_MODEL, device)
+                _embedder = model
+    return _embedder
+
+
+def warm_embedder() -> None:
+    """
+    Load the model and run one dummy batch so the first real request does not
+    pay for weight loading or kernel/allocator warmup.
+    """
+    get_embedder().encode(["warmup"], show_progress_bar=False)
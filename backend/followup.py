@@ -1,24 +1,45 @@
 # backend/followup.py
 
-import json
 import re
 import logging
+import orjson
 from fastapi import APIRouter, HTTPException
 from typing import Dict, Any, List
-from .business import _call_groq_with_retries, SUMMARY_MODEL
+from .business import _acall_groq_with_retries, _cache_get, _cache_put, _payload_key, SUMMARY_MODEL
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+_ARRAY_RE = re.compile(r"\[.*?\]", re.DOTALL)
+
+# ─── Static prompt prefixes (only the summary/competitors vary per request) ───
+_COMPETITOR_PROMPT = (
+    "You are a business consultant. "
+    "Given the business summary and these competitors, "
+    "output EXACTLY 3 follow-up questions as a JSON object of the form "
+    "{\"questions\": [\"...\", \"...\", \"...\"]}, "
+    "focused on each competitor's impact and strategy, referencing competitors by name.\n\n"
+    "Business Summary:\n"
+)
+_GENERAL_PROMPT = (
+    "You are a business consultant. "
+    "Output EXACTLY 3 follow-up questions as a JSON object of the form "
+    "{\"questions\": [\"...\", \"...\", \"...\"]}, "
+    "with no extra text or numbering, based on this summary:\n\n"
+)
+
 @router.post(
     "/generate_followup_queries",
     response_model=Dict[str, List[str]]
 )
-async def generate_followup_queries(request: Dict[str, Any]) -> Dict[str, List[str]]:
+async def generate_followup_queries(
+    request: Dict[str, Any], no_cache: bool = False
+) -> Dict[str, List[str]]:
     """
     Generate exactly 3 follow-up questions based on the business summary.
     If topic == 'competitors' and a competitors list is provided,
     the questions will reference competitors by name.
+    Pass `?no_cache=true` to bypass the cached LLM response.
     """
     summary     = request.get("summary")
     topic       = request.get("topic")
@@ -30,36 +51,33 @@ async def generate_followup_queries(request: Dict[str, Any]) -> Dict[str, List[s
     # 1) Construct the system prompt
     if topic == "competitors" and competitors:
         comp_str = ", ".join(competitors)
-        system_msg = (
-            "You are a business consultant. "
-            "Given the business summary and these competitors, "
-            "output EXACTLY 3 follow-up questions as a JSON array of strings, "
-            "focused on each competitor's impact and strategy, referencing competitors by name.\n\n"
-            "Business Summary:\n"
-            f"{summary}\n\n"
-            f"Key Competitors: {comp_str}"
-        )
+        system_msg = f"{_COMPETITOR_PROMPT}{summary}\n\nKey Competitors: {comp_str}"
     else:
-        system_msg = (
-            "You are a business consultant. "
-            "Output EXACTLY 3 follow-up questions as a JSON array of strings, "
-            "with no extra text or numbering, based on this summary:\n\n"
-            f"{summary}"
-        )
+        system_msg = f"{_GENERAL_PROMPT}{summary}"
 
     messages = [{"role": "system", "content": system_msg}]
-    payload = {"model": SUMMARY_MODEL, "messages": messages, "max_tokens": 150}
+    payload = {
+        "model": SUMMARY_MODEL,
+        "messages": messages,
+        "max_tokens": 150,
+        "response_format": {"type": "json_object"},
+    }
 
     # 2) Call the LLM
-    data = _call_groq_with_retries(payload)
+    key = _payload_key(payload)
+    if not no_cache and (cached := _cache_get(key)) is not None:
+        return cached
+    data = await _acall_groq_with_retries(payload)
     raw = data["choices"][0]["message"]["content"]
     logger.debug("LLM raw output for follow-ups: %s", raw)
 
-    # 3) Parse the JSON array of questions
+    # 3) Parse the {"questions": [...]} object (bare array accepted as a fallback)
     try:
-        questions = json.loads(raw.strip())
-    except json.JSONDecodeError:
-        match = re.search(r"\[.*?\]", raw, re.DOTALL)
+        questions = orjson.loads(raw.strip())
+        if isinstance(questions, dict):
+            questions = questions.get("questions")
+    except orjson.JSONDecodeError:
+        match = _ARRAY_RE.search(raw)
         if not match:
             logger.error("No JSON array found in LLM output: %s", raw)
             raise HTTPException(
@@ -67,8 +85,8 @@ async def generate_followup_queries(request: Dict[str, Any]) -> Dict[str, List[s
                 detail=f"No JSON array found in LLM output:\n{raw}"
             )
         try:
-            questions = json.loads(match.group())
-        except json.JSONDecodeError:
+            questions = orjson.loads(match.group())
+        except orjson.JSONDecodeError:
             logger.error("Failed to parse extracted JSON array: %s", match.group())
             raise HTTPException(
                 status_code=500,
@@ -87,5 +105,7 @@ async def generate_followup_queries(request: Dict[str, Any]) -> Dict[str, List[s
             detail=f"Expected list of >=3 strings, got: {questions}"
         )
 
-    # 5) Return exactly three questions
-    return {"questions": questions[:3]}
+    # 5) Return exactly three questions; only validated output is cached
+    result = {"questions": questions[:3]}
+    _cache_put(key, result)
+    return result
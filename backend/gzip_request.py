@@ -0,0 +1,64 @@
+# backend/gzip_request.py
+
+import zlib
+
+from fastapi.responses import ORJSONResponse
+
+# Refuse bodies that inflate past this size (guards against gzip bombs)
+MAX_INFLATED_BYTES = 256 * 1024 * 1024
+
+
+class GzipRequestMiddleware:
+    """
+    Transparently inflate request bodies sent with `Content-Encoding: gzip`,
+    so endpoints see plain JSON. Other requests pass through untouched.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not any(
+            k == b"content-encoding" and v.strip().lower() == b"gzip" for k, v in scope["headers"]
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        inflater = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+        parts = []
+        size = 0
+        more_body = True
+        try:
+            while more_body:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    return
+                more_body = message.get("more_body", False)
+                chunk = inflater.decompress(message.get("body", b""), MAX_INFLATED_BYTES + 1 - size)
+                size += len(chunk)
+                if size > MAX_INFLATED_BYTES:
+                    await ORJSONResponse({"detail": "Request body too large"}, status_code=413)(scope, receive, send)
+                    return
+                parts.append(chunk)
+            parts.append(inflater.flush())
+        except zlib.error:
+            await ORJSONResponse({"detail": "Invalid gzip request body"}, status_code=400)(scope, receive, send)
+            return
+
+        body = b"".join(parts)
+        headers = [
+            (k, v) for k, v in scope["headers"] if k not in (b"content-encoding", b"content-length")
+        ]
+        headers.append((b"content-length", str(len(body)).encode()))
+        scope = dict(scope, headers=headers)
+
+        delivered = False
+
+        async def receive_inflated():
+            nonlocal delivered
+            if not delivered:
+                delivered = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        await self.app(scope, receive_inflated, send)
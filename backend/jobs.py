@@ -0,0 +1,63 @@
+# backend/jobs.py
+
+import asyncio
+import logging
+import time
+import uuid
+from typing import Any, Awaitable, Dict, Set
+
+from fastapi import APIRouter, HTTPException
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+JOB_TTL = 60 * 60  # seconds a finished job's result is kept for polling
+
+_jobs: Dict[str, Dict[str, Any]] = {}
+_tasks: Set[asyncio.Task] = set()  # strong refs so running tasks aren't GC'd
+
+
+def _prune() -> None:
+    cutoff = time.time() - JOB_TTL
+    for job_id in [j for j, job in _jobs.items() if job["finished"] and job["finished"] < cutoff]:
+        del _jobs[job_id]
+
+
+async def _run(job_id: str, work: Awaitable[Any]) -> None:
+    job = _jobs[job_id]
+    job["status"] = "running"
+    try:
+        job["result"] = await work
+        job["status"] = "done"
+    except HTTPException as e:
+        job["status"], job["error"] = "failed", e.detail
+    except Exception as e:
+        logger.exception("Job %s failed", job_id)
+        job["status"], job["error"] = "failed", str(e)
+    finally:
+        job["finished"] = time.time()
+
+
+def submit(work: Awaitable[Any]) -> str:
+    """
+    Schedule `work` on the running event loop and return a job ID that can be
+    polled at GET /jobs/{job_id}.
+    """
+    _prune()
+    job_id = uuid.uuid4().hex
+    _jobs[job_id] = {"status": "pending", "result": None, "error": None, "finished": None}
+    task = asyncio.create_task(_run(job_id, work))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return job_id
+
+
+@router.get("/jobs/{job_id}", response_model=Dict[str, Any])
+async def get_job(job_id: str) -> Dict[str, Any]:
+    """
+    Poll a background job: status is one of pending | running | done | failed.
+    """
+    job = _jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return {"job_id": job_id, "status": job["status"], "result": job["result"], "error": job["error"]}
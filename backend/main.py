@@ -1,9 +1,11 @@
+import asyncio
 import logging
 import os
 from typing import Any, Dict, List
 
-from fastapi import FastAPI, HTTPException
+from fastapi import Body, FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, Field, HttpUrl
 
 from .embeddings import upsert_embeddings
@@ -11,6 +13,9 @@ from .clustering import cluster_embeddings
 from .persona_gen import generate_personas
 from .business import summarize_business, summarize_profile
 from .webfill import SmartWebScraper
+from .jobs import router as jobs_router, submit as submit_job
+from .embeddings_model import warm_embedder
+from .gzip_request import GzipRequestMiddleware
 
 # ─── New routers ───────────────────────────────────────────────────────────────
 from .followup import router as followup_router
@@ -22,17 +27,12 @@ logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(mess
 logger = logging.getLogger(__name__)
 
 # ─── Pydantic models ────────────────────────────────────────────────────────────
-class Profile(BaseModel):
-    customer_id: Any = Field(..., description="Unique customer identifier")
-    class Config:
-        extra = "allow"
-
-class ProfilesRequest(BaseModel):
-    profiles: List[Profile] = Field(..., description="List of customer profiles")
-
 class PersonasResponse(BaseModel):
     personas: List[Dict[str, Any]] = Field(..., description="Generated persona objects")
 
+class JobResponse(BaseModel):
+    job_id: str = Field(..., description="Poll GET /jobs/{job_id} for status and result")
+
 class BizRequest(BaseModel):
     business: Dict[str, Any] = Field(..., description="Raw new-business input data")
 
@@ -48,7 +48,8 @@ app = FastAPI(
         "Embed & cluster existing data into personas, "
         "summarize new-business inputs into profiles and human-readable summaries"
     ),
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
 )
 
 app.add_middleware(
@@ -57,6 +58,15 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(GzipRequestMiddleware)  # large clients POST gzip-encoded JSON
+
+# ─── Warm the shared embedder in the background (startup is not blocked) ──────
+_warmup_task = None
+
+@app.on_event("startup")
+async def _warm_embedder() -> None:
+    global _warmup_task
+    _warmup_task = asyncio.create_task(asyncio.to_thread(warm_embedder))
 
 # ─── Health check ───────────────────────────────────────────────────────────────
 @app.get("/health")
@@ -69,36 +79,69 @@ async def health_check() -> Dict[str, str]:
     response_model=PersonasResponse,
     summary="Generate personas from existing customer data",
 )
-async def process_profiles(request: ProfilesRequest) -> PersonasResponse:
-    profiles = [p.dict() for p in request.profiles]
-    logger.info("Received %d profiles", len(profiles))
+async def process_profiles(
+    profiles: List[Dict[str, Any]] = Body(..., embed=True, description="List of customer profiles"),
+) -> PersonasResponse:
+    _validate_profiles(profiles)
     try:
-        triples  = upsert_embeddings(profiles)
-        logger.info("Upserted %d embeddings", len(triples))
-
-        clusters = cluster_embeddings(triples)
-        logger.info("Formed %d clusters", len(clusters))
-
-        personas = generate_personas(clusters)
-        logger.info("Generated %d personas", len(personas))
-
-        return PersonasResponse(personas=personas)
+        return PersonasResponse(personas=await run_pipeline(profiles))
     except Exception:
         logger.exception("Error in /process_profiles")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@app.post(
+    "/process_profiles/jobs",
+    response_model=JobResponse,
+    summary="Queue persona generation and poll GET /jobs/{job_id} for the result",
+)
+async def process_profiles_job(
+    profiles: List[Dict[str, Any]] = Body(..., embed=True, description="List of customer profiles"),
+) -> JobResponse:
+    _validate_profiles(profiles)
+
+    async def _work() -> Dict[str, Any]:
+        return {"personas": await run_pipeline(profiles)}
+
+    return JobResponse(job_id=submit_job(_work()))
+
+def _validate_profiles(profiles: List[Dict[str, Any]]) -> None:
+    # Raw dicts skip a per-profile Pydantic validate + dump; only `customer_id` is required
+    missing = [i for i, p in enumerate(profiles) if "customer_id" not in p]
+    if missing:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Profiles missing 'customer_id' at indices: {missing[:10]}",
+        )
+
+async def run_pipeline(profiles: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Embed -> cluster -> generate personas for a list of raw profile dicts.
+    """
+    logger.info("Received %d profiles", len(profiles))
+    triples  = await upsert_embeddings(profiles)
+    logger.info("Upserted %d embeddings", len(triples))
+
+    clusters = await asyncio.to_thread(cluster_embeddings, triples)  # HDBSCAN/UMAP are CPU-bound
+    logger.info("Formed %d clusters", len(clusters))
+
+    personas = await generate_personas(clusters)
+    logger.info("Generated %d personas", len(personas))
+    return personas
+
 # ─── Summarize raw business into structured JSON ───────────────────────────────
 @app.post(
     "/summarize_business",
     response_model=Dict[str, Any],
     summary="Summarize new-business owner inputs into a structured profile",
 )
-async def summarize_business_endpoint(request: BizRequest) -> Dict[str, Any]:
+async def summarize_business_endpoint(request: BizRequest, no_cache: bool = False) -> Dict[str, Any]:
     logger.info("Received business input: %s", request.business)
     try:
-        profile = summarize_business(request.business)
+        profile = await summarize_business(request.business, use_cache=not no_cache)
         logger.info("Structured profile: %s", profile)
         return profile
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("Error in /summarize_business")
         raise HTTPException(status_code=500, detail=str(e))
@@ -128,7 +171,7 @@ async def extract_business_info(request: ExtractRequest) -> Dict[str, Any]:
             raise HTTPException(status_code=500, detail="Website analysis failed")
 
         # Map the free-form summary into your structured business profile
-        structured = summarize_business({
+        structured = await summarize_business({
             "summary": results["final_summary"]
         })
         logger.info("Auto-filled profile: %s", structured)
@@ -146,12 +189,14 @@ async def extract_business_info(request: ExtractRequest) -> Dict[str, Any]:
     response_model=Dict[str, str],
     summary="Generate a human-readable summary from a structured business profile",
 )
-async def summarize_profile_endpoint(profile: Dict[str, Any]) -> Dict[str, str]:
+async def summarize_profile_endpoint(profile: Dict[str, Any], no_cache: bool = False) -> Dict[str, str]:
     logger.info("Received profile for summarization: %s", profile)
     try:
-        summary = summarize_profile(profile)
+        summary = await summarize_profile(profile, use_cache=not no_cache)
         logger.info("Generated summary: %s", summary)
         return {"summary": summary}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("Error in /summarize_profile")
         raise HTTPException(status_code=500, detail=str(e))
@@ -163,4 +208,7 @@ app.include_router(followup_router, prefix="", tags=["followup"])
 app.include_router(youtube_router, prefix="", tags=["youtube"])
 
 # ─── Comment-based personas endpoint ──────────────────────────────────────────
-app.include_router(comment_personas_router, prefix="", tags=["personas"])
\ No newline at end of file
+app.include_router(comment_personas_router, prefix="", tags=["personas"])
+
+# ─── Background job status endpoint ───────────────────────────────────────────
+app.include_router(jobs_router, prefix="", tags=["jobs"])
\ No newline at end of file
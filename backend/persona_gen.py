@@ -1,13 +1,20 @@
 import os
-import json
+import asyncio
 import logging
-import re
-from typing import List, Dict, Any
+import hashlib
+import threading
+import orjson
+from typing import List, Dict, Any, Optional, Tuple
 
+import diskcache
+import numpy as np
 from dotenv import load_dotenv
 from fastapi import HTTPException
 from langchain_groq import ChatGroq
 
+from .business import _acall_groq_with_retries
+from .embeddings_model import get_embedder
+
 # ─── Load config & setup logging ─────────────────────────────────────────────
 load_dotenv()
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
@@ -17,118 +24,320 @@ if not GROQ_API_KEY:
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-# ─── Instantiate Groq LLM ────────────────────────────────────────────────────
+PERSONA_MODEL       = "llama-3.1-8b-instant"
+PERSONA_MAX_TOKENS  = 600
+PERSONA_BATCH_SIZE  = 8  # clusters packed into one batched LLM call
+PERSONA_CONCURRENCY = int(os.getenv("GROQ_CONCURRENCY", "8"))  # max in-flight Groq persona calls, process-wide
+
+# Shared by every generate_personas() call so concurrent requests respect one cap
+_groq_sem = asyncio.Semaphore(PERSONA_CONCURRENCY)
+
+# ─── Persona cache: exact fingerprint on disk + in-process semantic index ────
+PERSONA_CACHE_DIR  = os.getenv("PERSONA_CACHE_DIR", ".cache/personas")
+SEMANTIC_THRESHOLD = 0.95  # cosine similarity for a near-duplicate cluster hit
+
+SEMANTIC_INDEX_SIZE = 4096  # newest cluster embeddings kept for near-duplicate lookup
+_SEMANTIC_SEGMENTS_KEY = "__semantic_segments__"
+
+_persona_cache = diskcache.Cache(PERSONA_CACHE_DIR)
+
+
+def _segment_key(seg: int) -> str:
+    return f"{_SEMANTIC_SEGMENTS_KEY}:{seg}"
+
+
+def _load_semantic_index() -> Tuple[List[Tuple[int, int]], Tuple[List[str], np.ndarray]]:
+    """
+    The index is persisted as append-only segments (one per store), listed oldest first
+    as (segment id, rows) under _SEMANTIC_SEGMENTS_KEY, so a store never re-pickles it all.
+    """
+    segments = _persona_cache.get(_SEMANTIC_SEGMENTS_KEY, [])
+    keys: List[str] = []
+    mats: List[np.ndarray] = []
+    for seg, _ in segments:
+        entry = _persona_cache.get(_segment_key(seg))
+        if entry is not None:
+            keys += entry[0]
+            mats.append(entry[1])
+    if not mats:
+        return segments, ([], np.empty((0, 0), dtype=np.float32))
+    return segments, (keys[-SEMANTIC_INDEX_SIZE:], np.vstack(mats)[-SEMANTIC_INDEX_SIZE:])
+
+
+# (cache keys, stacked embeddings), persisted next to the personas so restarts keep it
+_semantic_segments, _semantic_index = _load_semantic_index()
+_semantic_lock = threading.Lock()
+
+PERSONA_KEYS = (
+    "Include ONLY these keys: persona_name (string), demographics (object), goals (object), "
+    "pain_points (array of strings), channels (object), content_preferences (object), marketing_strategy (object). "
+)
+
+# ─── Static system prompts ───────────────────────────────────────────────────
+_BATCH_SYSTEM = {
+    "role": "system",
+    "content": (
+        "You are an expert market researcher. For EACH cluster in the input, create exactly one persona. "
+        "Respond with a JSON object {\"personas\": [...]} holding one object per cluster, each with a "
+        "cluster_id (integer, copied from the input) plus the persona fields. "
+        "Every persona must be distinct in persona_name, demographics, goals, and pain_points. "
+        + PERSONA_KEYS +
+        "Numeric ranges (e.g. \"28-35\") must be strings."
+    ),
+}
+
+_ONE_SYSTEM = (
+    "system",
+    (
+        "You are an expert market researcher. The input is a JSON object with a cluster_id, "
+        "previous_persona_names and the cluster's comments. Create exactly one JSON persona for that cluster, "
+        "distinct in persona_name, demographics, goals, and pain_points from all previous personas. "
+        + PERSONA_KEYS +
+        "Numeric ranges (e.g. \"28-35\") must be strings."
+    )
+)
+
+# ─── Instantiate Groq LLM (JSON mode: the API guarantees a valid JSON object) ─
 llm = ChatGroq(
     api_key=GROQ_API_KEY,
-    model="llama-3.1-8b-instant",
+    model=PERSONA_MODEL,
     temperature=0.0,
-    max_tokens=600,
+    max_tokens=PERSONA_MAX_TOKENS,
     max_retries=2,
     reasoning_format=None,
-    timeout=None
+    timeout=None,
+    model_kwargs={"response_format": {"type": "json_object"}},
 )
 
 
-def _extract_json(raw: str) -> Dict[str, Any]:
+def _member_texts(members: List[Dict[str, Any]]) -> List[str]:
+    return [p.get("text", "") for p in members if p.get("text")]
+
+
+def _fingerprint(texts: List[str]) -> str:
+    return hashlib.blake2b(orjson.dumps(sorted(texts))).hexdigest()
+
+
+def _normalize(vec: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(vec)
+    return (vec / norm if norm > 0 else vec).astype(np.float32)
+
+
+def _cache_lookup(
+    texts_by_label: Dict[int, List[str]]
+) -> Tuple[Dict[int, Dict[str, Any]], Dict[int, np.ndarray]]:
+    """
+    Return ({label: cached persona}, {label: embedding of each miss}). Clusters are matched
+    by exact fingerprint first, then by cosine similarity against the semantic index.
+    A cluster's embedding is the normalized mean of its per-comment embeddings, all encoded
+    in one pass; misses get theirs back so they can be stored without re-encoding.
+    Blocking (disk + model): call via asyncio.to_thread.
+    """
+    hits: Dict[int, Dict[str, Any]] = {}
+    pending: Dict[int, List[str]] = {}
+    used: set = set()  # cache keys already handed out in this call
+    for label, texts in texts_by_label.items():
+        key = _fingerprint(texts)
+        persona = None if key in used else _persona_cache.get(key)
+        if persona is not None:
+            used.add(key)
+            hits[label] = persona
+        else:
+            pending[label] = texts
+    if not pending:
+        return hits, {}
+
+    unique = list(dict.fromkeys(t for texts in pending.values() for t in texts))
+    row = {t: i for i, t in enumerate(unique)}
+    embs = get_embedder().encode(
+        unique, batch_size=64, convert_to_numpy=True, normalize_embeddings=True
+    ).astype(np.float32, copy=False)
+    vecs = {
+        label: _normalize(embs[[row[t] for t in texts]].mean(axis=0))
+        for label, texts in pending.items()
+    }
+
+    # Each cached persona serves at most one cluster per call; the best-matching pairs
+    # claim theirs first and any other near-duplicate clusters go to the LLM
+    keys, index = _semantic_index
+    if keys:
+        labels = list(vecs)
+        sims = np.stack([vecs[l] for l in labels]) @ index.T
+        rows, cols = np.nonzero(sims >= SEMANTIC_THRESHOLD)
+        for r in np.argsort(-sims[rows, cols], kind="stable"):
+            label, key = labels[rows[r]], keys[cols[r]]
+            if label in hits or key in used:
+                continue
+            persona = _persona_cache.get(key)
+            if persona is not None:
+                used.add(key)
+                hits[label] = persona
+                del vecs[label]
+    return hits, vecs
+
+
+def _cache_store(entries: List[Tuple[List[str], Optional[np.ndarray], Dict[str, Any]]]) -> None:
+    """
+    Store (texts, embedding, persona) entries on disk and add their embeddings to the
+    semantic index, keeping only the newest SEMANTIC_INDEX_SIZE. Only the new rows are
+    written, as one segment; segments that fell entirely out of the index are deleted.
+    Blocking (disk): call via asyncio.to_thread.
+    """
+    global _semantic_index
+    new_keys: List[str] = []
+    new_vecs: List[np.ndarray] = []
+    for texts, vec, persona in entries:
+        key = _fingerprint(texts)
+        _persona_cache.set(key, persona)
+        if vec is not None:
+            new_keys.append(key)
+            new_vecs.append(vec)
+    if not new_keys:
+        return
+    with _semantic_lock:
+        keys, index = _semantic_index
+        keys = (keys + new_keys)[-SEMANTIC_INDEX_SIZE:]
+        index = np.vstack([index.reshape(-1, new_vecs[0].shape[0]), *new_vecs])[-SEMANTIC_INDEX_SIZE:]
+        _semantic_index = (keys, index)  # one assignment, so readers never see a torn pair
+
+        seg = _semantic_segments[-1][0] + 1 if _semantic_segments else 0
+        _persona_cache.set(_segment_key(seg), (new_keys, np.stack(new_vecs)))
+        _semantic_segments.append((seg, len(new_keys)))
+        total = sum(n for _, n in _semantic_segments)
+        while total - _semantic_segments[0][1] >= SEMANTIC_INDEX_SIZE:
+            old, n = _semantic_segments.pop(0)
+            total -= n
+            _persona_cache.delete(_segment_key(old))
+        _persona_cache.set(_SEMANTIC_SEGMENTS_KEY, _semantic_segments)
+
+
+async def _generate_batch(
+    batch: List[Tuple[int, List[Dict[str, Any]]]]
+) -> Dict[int, Dict[str, Any]]:
+    """
+    Generate personas for several clusters in a single JSON-mode LLM call.
+    Returns {cluster_id: persona}; clusters the model skipped are simply absent.
     """
-    Extract the first JSON object from LLM output, with fallback quoting for numeric ranges.
+    clusters_in = [
+        {"cluster_id": int(label), "comments": _member_texts(members)}
+        for label, members in batch
+    ]
+    payload = {
+        "model": PERSONA_MODEL,
+        "messages": [
+            _BATCH_SYSTEM,
+            {"role": "user", "content": orjson.dumps({"clusters": clusters_in}).decode()},
+        ],
+        "temperature": 0.0,
+        "max_tokens": PERSONA_MAX_TOKENS * len(batch),
+        "response_format": {"type": "json_object"},
+    }
+    data = await _acall_groq_with_retries(payload)
+    parsed = orjson.loads(data["choices"][0]["message"]["content"])
+
+    wanted = {int(label) for label, _ in batch}
+    personas: Dict[int, Dict[str, Any]] = {}
+    for persona in parsed.get("personas", []):
+        if not isinstance(persona, dict):
+            continue
+        try:
+            cid = int(persona.pop("cluster_id"))
+        except (KeyError, TypeError, ValueError):
+            continue
+        if cid in wanted:
+            personas[cid] = persona
+    return personas
+
+
+async def _generate_one(
+    label: int, members: List[Dict[str, Any]], generated_names: List[str]
+) -> Dict[str, Any]:
     """
-    text = raw.strip()
-    # Remove code fences if present
-    if text.startswith("```"):
-        text = text.split("```")[1]
-    if text.endswith("```"):
-        text = text.rsplit("```")[0]
-
-    # Find balanced braces
-    start = text.find("{")
-    if start < 0:
-        raise ValueError("No JSON object found in LLM output")
-    depth = 0
-    for i, ch in enumerate(text[start:], start):
-        if ch == "{":
-            depth += 1
-        elif ch == "}":
-            depth -= 1
-            if depth == 0:
-                obj_str = text[start : i + 1]
-                try:
-                    return json.loads(obj_str)
-                except json.JSONDecodeError:
-                    # Fallback: quote simple numeric ranges
-                    fixed = re.sub(r'("\w+"\s*:\s*)(\d+-\d+)', r'\1"\2"', obj_str)
-                    return json.loads(fixed)
-    raise ValueError("Unmatched braces in LLM output")
-
-
-def generate_personas(
+    Per-cluster fallback: one JSON-mode LLM call for a single cluster.
+    """
+    human_msg = (
+        "human",
+        orjson.dumps({
+            "cluster_id": int(label),
+            "previous_persona_names": generated_names,
+            "comments": _member_texts(members),
+        }).decode(),
+    )
+    ai_msg = await llm.ainvoke([_ONE_SYSTEM, human_msg])
+    return orjson.loads(ai_msg.content)
+
+
+async def generate_personas(
     clusters: Dict[int, List[Dict[str, Any]]]
 ) -> List[Dict[str, Any]]:
     """
-    Generate a distinct persona JSON for each cluster using ChatGroq.
-    Instructs the LLM to tailor each persona to its cluster comments and avoid repetition across clusters.
+    Generate a distinct persona JSON for each cluster using Groq.
+    Clusters are packed PERSONA_BATCH_SIZE at a time into single JSON-mode calls; any cluster
+    whose batch fails to parse falls back to a per-cluster call. All calls run concurrently,
+    capped at PERSONA_CONCURRENCY in flight across the process. Clusters that still fail are logged and skipped.
     """
-    personas: List[Dict[str, Any]] = []
-    generated_names: List[str] = []
+    all_items = [(label, members) for label, members in clusters.items() if label != -1]
+
+    # 0) Serve repeated (or near-identical) clusters from the persona cache.
+    #    Clusters without texts have nothing to fingerprint (they would all collide).
+    texts_by_label = {int(label): _member_texts(members) for label, members in all_items}
+    by_label, vecs = await asyncio.to_thread(
+        _cache_lookup, {label: texts for label, texts in texts_by_label.items() if texts}
+    )
+    for label in by_label:
+        logger.info("Cluster %d persona served from cache", label)
+    items = [(label, members) for label, members in all_items if int(label) not in by_label]
+
+    batches = [items[i : i + PERSONA_BATCH_SIZE] for i in range(0, len(items), PERSONA_BATCH_SIZE)]
+
+    async def _limited(coro):
+        async with _groq_sem:
+            return await coro
 
-    for label, members in clusters.items():
-        if label == -1:
+    # 1) Batched calls
+    results = await asyncio.gather(
+        *[_limited(_generate_batch(b)) for b in batches], return_exceptions=True
+    )
+    for batch, result in zip(batches, results):
+        if isinstance(result, Exception):
+            logger.warning("Batched persona call failed for clusters %s: %s", [l for l, _ in batch], result)
             continue
+        by_label.update(result)
 
-        # List of previous persona names for uniqueness constraint
-        prev_list = ", ".join(generated_names) if generated_names else "none"
-
-        # 1) System prompt: enforce valid JSON and distinctness
-        system_msg = (
-            "system",
-            (
-                f"You are an expert market researcher. Create exactly one JSON persona for cluster {label}. "
-                f"Previously generated persona names: {prev_list}. "
-                "Ensure this persona is distinct in persona_name, demographics, goals, and pain_points from all previous ones. "
-                "Include ONLY these keys: persona_name (string), demographics (object), goals (object), "
-                "pain_points (array of strings), channels (object), content_preferences (object), marketing_strategy (object). "
-                "All keys and values must be double-quoted. Numeric ranges (e.g. \"28-35\") must be strings. "
-                "Do NOT include comments, markdown, or trailing commas. Use JSON arrays for lists."
-            )
-        )
-
-        # 2) Human prompt: provide cluster-specific comments
-        texts = [p.get("text", "") for p in members if p.get("text")]
-        human_msg = (
-            "human",
-            (
-                f"Here are the comments for cluster {label}. Derive a unique persona JSON object:\n\n" +
-                "\n".join(texts)
-            )
-        )
-
-        # 3) Invoke the LLM
-        try:
-            ai_msg = llm.invoke([system_msg, human_msg])
-            raw = ai_msg.content
-
-            # 4) Normalize set-like pain_points to JSON arrays
-            raw = re.sub(
-                r'("pain_points"\s*:\s*)\{\s*([^}]+?)\s*\}',
-                lambda m: f"{m.group(1)}[{m.group(2).strip()}]",
-                raw,
-                flags=re.DOTALL
-            )
-
-            # 5) Extract JSON with fallback
-            persona = _extract_json(raw)
-            personas.append(persona)
-            # Track name for next iteration
-            name = persona.get("persona_name", "").strip()
-            if name:
-                generated_names.append(name)
-
-            logger.info("Cluster %d persona generated: %s", label, name)
-        except Exception as e:
-            logger.error(
-                "Error generating persona for cluster %d: %s\nRaw output:\n%s",
-                label, e, raw if 'raw' in locals() else ""
-            )
-            raise HTTPException(status_code=500, detail=f"Cluster {label}: {e}")
+    # 2) Per-cluster fallback for anything the batches did not cover
+    generated_names: List[str] = [
+        p.get("persona_name", "").strip() for p in by_label.values() if p.get("persona_name")
+    ]
+    missing = [(label, members) for label, members in items if int(label) not in by_label]
+    fallback = await asyncio.gather(
+        *[_limited(_generate_one(label, members, generated_names)) for label, members in missing],
+        return_exceptions=True,
+    )
+    for (label, _), result in zip(missing, fallback):
+        if isinstance(result, Exception):
+            logger.error("Error generating persona for cluster %d: %s", label, result)
+            continue
+        by_label[int(label)] = result
+
+    if all_items and not by_label:
+        raise HTTPException(status_code=500, detail="Persona generation failed for every cluster")
+
+    # 3) Remember fresh results
+    fresh = [
+        (texts_by_label[int(label)], vecs.get(int(label)), by_label[int(label)])
+        for label, _ in items
+        if int(label) in by_label and texts_by_label[int(label)]
+    ]
+    if fresh:
+        await asyncio.to_thread(_cache_store, fresh)
+
+    # 4) Preserve cluster order
+    personas: List[Dict[str, Any]] = []
+    for label, _ in all_items:
+        persona = by_label.get(int(label))
+        if persona is None:
+            continue
+        personas.append(persona)
+        logger.info("Cluster %d persona generated: %s", label, persona.get("persona_name", ""))
 
     return personas
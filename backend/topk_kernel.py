@@ -0,0 +1,31 @@
+# backend/topk_kernel.py
+
+import numpy as np
+from numba import njit, prange
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def top_k_cosine(q_embs, c_embs, cols, k):
+    """
+    Dot every query against the comment rows in `cols` and keep the k best
+    per query via insertion into a sorted buffer (k is tiny, so no heap needed).
+    Returns (positions into `cols`, similarities), both shaped (n_queries, k).
+    """
+    n_q, dim = q_embs.shape
+    top_i = np.full((n_q, k), -1, np.int64)
+    top_v = np.full((n_q, k), -2.0, np.float32)  # below any cosine; fastmath rules out inf
+    for i in prange(n_q):
+        for jj in range(cols.shape[0]):
+            j = cols[jj]
+            s = np.float32(0.0)
+            for d in range(dim):
+                s += q_embs[i, d] * c_embs[j, d]
+            if s > top_v[i, k - 1]:
+                m = k - 1
+                while m > 0 and top_v[i, m - 1] < s:
+                    top_v[i, m] = top_v[i, m - 1]
+                    top_i[i, m] = top_i[i, m - 1]
+                    m -= 1
+                top_v[i, m] = s
+                top_i[i, m] = jj
+    return top_i, top_v
@@ -1,17 +1,22 @@
 # backend/youtube_router.py
 
-import re
+import asyncio
 from fastapi import APIRouter, HTTPException
-from typing import Dict, Any, List
-from .youtube_utils import yt, search_top_video_ids, fetch_top_comments
+from typing import Dict, Any, List, Tuple
+from .youtube_utils import get_yt, search_top_video_ids, fetch_english_comments, rank_comments
+from .jobs import submit as submit_job
 
 router = APIRouter()
 
+YT_FETCH_CONCURRENCY = 10  # parallel commentThreads calls, kept under YouTube QPS limits
+
 @router.post("/youtube_search", response_model=Dict[str, List[Dict[str, Any]]])
-async def youtube_search(request: Dict[str, Any]) -> Dict[str, List[Dict[str, Any]]]:
+def youtube_search(request: Dict[str, Any]) -> Dict[str, List[Dict[str, Any]]]:
     """
     Search YouTube for videos matching `query`, ordered by `order`,
     returning up to `max_results` videos with title, URL, and viewCount.
+    Plain `def` on purpose: the googleapiclient calls block, so FastAPI runs
+    this in its threadpool (get_yt() is per-thread) and searches overlap.
     """
     query = request.get("query")
     order = request.get("order", "viewCount")
@@ -26,10 +31,11 @@ async def youtube_search(request: Dict[str, Any]) -> Dict[str, List[Dict[str, An
     videos: List[Dict[str, Any]] = []
     try:
         # 2) Fetch detailed metadata for each video ID
-        resp = yt.videos().list(
+        resp = get_yt().videos().list(
             part="snippet,statistics",
             id=",".join(video_ids),
-            maxResults=len(video_ids)
+            maxResults=len(video_ids),
+            fields="items(id,snippet(title),statistics(viewCount))"
         ).execute()
 
         for item in resp.get("items", []):
@@ -51,6 +57,21 @@ async def youtube_comments_filtered(request: Dict[str, Any]) -> Dict[str, List[s
     For a list of video IDs and follow-up questions, fetch top semantically
 elevant comments per video-question pair, returning one best comment per video.
     """
+    video_ids, questions = _parse_comments_request(request)
+    return await _filtered_comments(video_ids, questions)
+
+
+@router.post("/youtube_comments_filtered/jobs", response_model=Dict[str, str])
+async def youtube_comments_filtered_job(request: Dict[str, Any]) -> Dict[str, str]:
+    """
+    Queue the same work as /youtube_comments_filtered and return a job ID
+    immediately; poll GET /jobs/{job_id} for the result.
+    """
+    video_ids, questions = _parse_comments_request(request)
+    return {"job_id": submit_job(_filtered_comments(video_ids, questions))}
+
+
+def _parse_comments_request(request: Dict[str, Any]) -> Tuple[List[str], List[str]]:
     video_ids = request.get("video_ids")
     questions = request.get("questions")
 
@@ -58,20 +79,32 @@ elevant comments per video-question pair, returning one best comment per video.
         raise HTTPException(status_code=400, detail="Missing or invalid 'video_ids'")
     if not questions or not isinstance(questions, list):
         raise HTTPException(status_code=400, detail="Missing or invalid 'questions'")
+    return video_ids, questions
 
-    output: Dict[str, List[str]] = {}
 
+async def _filtered_comments(video_ids: List[str], questions: List[str]) -> Dict[str, List[str]]:
+    # 1) Fetch each video's comment pool once (shared by every question), concurrently
+    sem = asyncio.Semaphore(YT_FETCH_CONCURRENCY)
+
+    async def _fetch(vid: str) -> List[str]:
+        async with sem:
+            return await asyncio.to_thread(fetch_english_comments, vid)
+
+    try:
+        pools = await asyncio.gather(*[_fetch(vid) for vid in video_ids])
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching comments: {e}")
+    comments_by_video = dict(zip(video_ids, pools))
+
+    # 2) Rank all (video, question) pairs from a single embedding pass
+    try:
+        ranked = await asyncio.to_thread(rank_comments, questions, comments_by_video)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error ranking comments: {e}")
+
+    # 3) Keep the best comment per question, mapped by video ID
+    output: Dict[str, List[str]] = {}
     for vid in video_ids:
-        best_comments: List[str] = []
-        for q in questions:
-            # fetch_top_comments returns comments ranked by semantic relevance
-            try:
-                comments = fetch_top_comments(vid, q)
-            except Exception as e:
-                raise HTTPException(status_code=500, detail=f"Error fetching comments for video {vid}: {e}")
-            if comments:
-                best_comments.append(comments[0])
-        # map video ID to its top comments list
-        output[vid] = best_comments
+        output[vid] = [comments[0] for comments in ranked[vid] if comments]
 
     return output
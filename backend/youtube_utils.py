@@ -2,11 +2,15 @@
 
 import os
 import logging
+import threading
+import diskcache
+import httplib2
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from typing import List
-from langdetect import detect
-from sentence_transformers import SentenceTransformer, util
+from typing import Dict, List
+import numpy as np
+
+from .embeddings_model import get_embedder
 
 logger = logging.getLogger(__name__)
 
@@ -15,11 +19,192 @@ YOUTUBE_API_KEY = os.getenv("YOUTUBE_API_KEY")
 if not YOUTUBE_API_KEY:
     raise RuntimeError("YOUTUBE_API_KEY missing in .env")
 
-# 2. Initialize the YouTube Data API v3 client
-yt = build("youtube", "v3", developerKey=YOUTUBE_API_KEY)
+# 2. YouTube Data API v3 clients. httplib2 keeps connections alive per Http object
+#    but is not thread-safe, so each thread gets its own client + connection pool.
+_local = threading.local()
+
+
+def get_yt():
+    """
+    Return this thread's YouTube client, building it (and its keep-alive
+    httplib2 connection pool) on first use.
+    """
+    client = getattr(_local, "yt", None)
+    if client is None:
+        client = build(
+            "youtube", "v3",
+            developerKey=YOUTUBE_API_KEY,
+            http=httplib2.Http(timeout=30),
+            cache_discovery=False,
+        )
+        _local.yt = client
+    return client
+
+# 3. Load the fastText language-ID model (https://fasttext.cc/docs/en/language-identification.html)
+#    Loaded lazily so a missing model file (or fasttext package) cannot stop the API
+#    from importing; without it, comments are kept unfiltered.
+LID_MODEL_PATH = os.getenv("FASTTEXT_LID_MODEL", "lid.176.ftz")
+_lid = None
+_lid_failed = False
+_lid_lock = threading.Lock()
+
+
+def get_lid():
+    """Return the fastText language-ID model, or None if it could not be loaded."""
+    global _lid, _lid_failed
+    if _lid is None and not _lid_failed:
+        with _lid_lock:
+            if _lid is None and not _lid_failed:
+                try:
+                    import fasttext
+
+                    _lid = fasttext.load_model(LID_MODEL_PATH)
+                except Exception as e:
+                    _lid_failed = True
+                    logger.error(
+                        "Could not load fastText language-ID model from %s (%s); "
+                        "comments will not be language-filtered", LID_MODEL_PATH, e
+                    )
+    return _lid
+
+# 4. Load the embedding model on first use for semantic ranking. Prefer an int8-quantized
+#    ONNX export of MiniLM when present; build it once with:
+#      optimum-cli export onnx --model sentence-transformers/all-MiniLM-L6-v2 <dir>
+#      optimum-cli onnxruntime quantize --onnx_model <dir> --avx512_vnni -o <dir>
+ONNX_EMBED_DIR = os.getenv("ONNX_EMBED_DIR", "models/all-MiniLM-L6-v2-int8")
+ONNX_EMBED_FILE = "model_quantized.onnx"
+MAX_SEQ_LENGTH = 256  # matches the SentenceTransformer config for MiniLM
+
+
+def _load_encoder():
+    """
+    Return an `encode(texts, batch_size)` function producing L2-normalized
+    MiniLM embeddings as a torch tensor.
+    """
+    import torch
+
+    if os.path.isfile(os.path.join(ONNX_EMBED_DIR, ONNX_EMBED_FILE)):
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+        from transformers import AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(ONNX_EMBED_DIR)
+        model = ORTModelForFeatureExtraction.from_pretrained(ONNX_EMBED_DIR, file_name=ONNX_EMBED_FILE)
+        logger.info("Using int8 ONNX embedder from %s", ONNX_EMBED_DIR)
+
+        def encode(texts: List[str], batch_size: int = 128) -> "torch.Tensor":
+            chunks = []
+            for i in range(0, len(texts), batch_size):
+                batch = tokenizer(
+                    texts[i : i + batch_size],
+                    padding=True,
+                    truncation=True,
+                    max_length=MAX_SEQ_LENGTH,
+                    return_tensors="pt",
+                )
+                tokens = model(**batch).last_hidden_state
+                # Mean-pool over real tokens, then L2-normalize (as SentenceTransformer does)
+                mask = batch["attention_mask"].unsqueeze(-1).to(tokens.dtype)
+                pooled = (tokens * mask).sum(1) / mask.sum(1).clamp(min=1e-9)
+                chunks.append(torch.nn.functional.normalize(pooled, p=2, dim=1))
+            return torch.cat(chunks)
+
+        return encode
+
+    logger.info("No ONNX export at %s; using the shared SentenceTransformer", ONNX_EMBED_DIR)
+
+    def encode(texts: List[str], batch_size: int = 128) -> "torch.Tensor":
+        return get_embedder().encode(
+            texts,
+            batch_size=batch_size,
+            convert_to_tensor=True,
+            normalize_embeddings=True,
+        )
+
+    return encode
+
+
+_encoder = None
+_encoder_lock = threading.Lock()
+
+
+def get_encoder():
+    """Return the ranking encoder, loading it on first call."""
+    global _encoder
+    if _encoder is None:
+        with _encoder_lock:
+            if _encoder is None:
+                _encoder = _load_encoder()
+    return _encoder
+
+
+# Numba kernel for CPU-side ranking, compiled on first use; without numba the
+# torch path is used everywhere
+_top_k = None
+_top_k_failed = False
+_top_k_lock = threading.Lock()
+
+
+def get_top_k_kernel():
+    """Return the Numba top-k kernel, or None if numba is not installed."""
+    global _top_k, _top_k_failed
+    if _top_k is None and not _top_k_failed:
+        with _top_k_lock:
+            if _top_k is None and not _top_k_failed:
+                try:
+                    from .topk_kernel import top_k_cosine
+
+                    _top_k = top_k_cosine
+                except ImportError:
+                    _top_k_failed = True
+                    logger.info("numba not installed; ranking comments with torch")
+    return _top_k
+
+# 5. On-disk cache for YouTube API responses (saves RTT and daily quota).
+#    Errors are raised inside the memoized helpers, so failures are never cached.
+YT_CACHE_DIR = os.getenv("YT_CACHE_DIR", ".cache/youtube")
+YT_CACHE_TTL = 6 * 60 * 60  # seconds
+yt_cache = diskcache.Cache(YT_CACHE_DIR, size_limit=2**30)
 
-# 3. Load the embedding model once for semantic ranking
-embedder = SentenceTransformer("all-MiniLM-L6-v2")
+COMMENTS_PAGE_SIZE = 100  # API maximum for commentThreads.list
+MAX_COMMENT_PAGES = 5
+
+
+@yt_cache.memoize(expire=YT_CACHE_TTL, tag="yt_search")
+def _search_video_ids(query: str, max_results: int) -> List[str]:
+    resp = get_yt().search().list(
+        part="id",
+        q=query,
+        type="video",
+        maxResults=max_results,
+        fields="items(id/videoId)"
+    ).execute()
+    return [item["id"]["videoId"] for item in resp.get("items", [])]
+
+
+@yt_cache.memoize(expire=YT_CACHE_TTL, tag="yt_comments")
+def _fetch_comment_texts(video_id: str, pool_size: int, max_pages: int) -> List[str]:
+    # commentThreads caps a page at 100; each nextPageToken is only known once the
+    # previous page arrives, so pages are chained (videos are fetched concurrently upstream)
+    texts: List[str] = []
+    page_token = None
+    for _ in range(max_pages):
+        resp = get_yt().commentThreads().list(
+            part="snippet",
+            videoId=video_id,
+            order="relevance",
+            textFormat="plainText",
+            maxResults=min(pool_size - len(texts), COMMENTS_PAGE_SIZE),
+            pageToken=page_token,
+            fields="nextPageToken,items(snippet(topLevelComment/snippet/textDisplay))"
+        ).execute()
+        texts.extend(
+            item["snippet"]["topLevelComment"]["snippet"]["textDisplay"]
+            for item in resp.get("items", [])
+        )
+        page_token = resp.get("nextPageToken")
+        if not page_token or len(texts) >= pool_size:
+            break
+    return texts[:pool_size]
 
 
 def search_top_video_ids(query: str, max_results: int = 5) -> List[str]:
@@ -27,40 +212,22 @@ def search_top_video_ids(query: str, max_results: int = 5) -> List[str]:
     Return up to `max_results` video IDs for a search query.
     """
     try:
-        resp = yt.search().list(
-            part="id",
-            q=query,
-            type="video",
-            maxResults=max_results
-        ).execute()
-        return [item["id"]["videoId"] for item in resp.get("items", [])]
+        return _search_video_ids(query, max_results)
     except HttpError as e:
         logger.warning("YouTube search failed for query '%s': %s", query, e)
         return []
 
 
-def fetch_top_comments(
-    video_id: str,
-    query: str,
-    max_comments: int = 3,
-    pool_size: int = 50,
-    min_similarity: float = 0.3
+def fetch_english_comments(
+    video_id: str, pool_size: int = 50, max_pages: int = MAX_COMMENT_PAGES
 ) -> List[str]:
     """
-    Fetch up to `pool_size` comments by relevance, filter to English, and return the top
-    `max_comments` comments most semantically similar to `query`.
-
-    - Skips videos with comments disabled.
-    - `min_similarity` thresholds similarity below which comments are discarded.
+    Fetch up to `pool_size` comments by relevance (as plain text, paging past
+    100 for at most `max_pages` pages) and keep the English ones.
+    Skips videos with comments disabled.
     """
-    # 1) Pull a pool of comments, handle disabled comments
     try:
-        resp = yt.commentThreads().list(
-            part="snippet",
-            videoId=video_id,
-            order="relevance",
-            maxResults=min(pool_size, 100)
-        ).execute()
+        raw_comments = _fetch_comment_texts(video_id, pool_size, max_pages)
     except HttpError as e:
         # 403 for commentsDisabled
         if hasattr(e, 'resp') and e.resp.status == 403:
@@ -69,39 +236,76 @@ def fetch_top_comments(
         logger.warning("YouTube commentThreads failed for video %s: %s", video_id, e)
         return []
 
-    # Extract the raw comment text
-    raw_comments = [
-        item["snippet"]["topLevelComment"]["snippet"]["textDisplay"]
-        for item in resp.get("items", [])
-    ]
-
-    # 2) Filter to English only
-    comments = []
-    for c in raw_comments:
-        try:
-            if detect(c) == "en":
-                comments.append(c)
-        except Exception:
-            continue
-
-    if not comments:
+    # Filter to English only, classifying the whole pool in one native call
+    if not raw_comments:
         return []
+    lid = get_lid()
+    if lid is None:
+        return raw_comments
+    try:
+        labels, _ = lid.predict([c.replace("\n", " ") for c in raw_comments], k=1)
+    except Exception as e:
+        logger.error("Language detection failed for video %s; keeping all comments: %s", video_id, e)
+        return raw_comments
+    return [c for c, lbl in zip(raw_comments, labels) if lbl and lbl[0] == "__label__en"]
 
-    # 3) Embed query and comments
-    q_emb = embedder.encode(query, convert_to_tensor=True)
-    c_embs = embedder.encode(comments, convert_to_tensor=True)
 
-    # 4) Compute cosine similarities
-    sims = util.cos_sim(q_emb, c_embs)[0]
 
-    # 5) Rank and select top comments above threshold
-    sorted_indices = sims.argsort(descending=True)
-    top_comments: List[str] = []
-    for idx in sorted_indices:
-        if float(sims[idx]) < min_similarity:
-            break
-        top_comments.append(comments[int(idx)])
-        if len(top_comments) >= max_comments:
-            break
+def rank_comments(
+    queries: List[str],
+    comments_by_video: Dict[str, List[str]],
+    max_comments: int = 3,
+    min_similarity: float = 0.3
+) -> Dict[str, List[List[str]]]:
+    """
+    For every video, return one list per query holding up to `max_comments` of that
+    video's comments most semantically similar to the query (similarity >= `min_similarity`).
+
+    All queries and all unique comments are embedded in a single `encode` call.
+    """
+    unique: Dict[str, int] = {}
+    for comments in comments_by_video.values():
+        for c in comments:
+            unique.setdefault(c, len(unique))
+    if not unique or not queries:
+        return {vid: [[] for _ in queries] for vid in comments_by_video}
+
+    import torch
 
-    return top_comments
+    # 1) One forward pass over queries + comments (normalized, so dot == cosine)
+    with torch.inference_mode():
+        embs = get_encoder()(queries + list(unique), batch_size=128)
+    q_embs, c_embs = embs[:len(queries)], embs[len(queries):]
+
+    # 2) On CPU, rank with the fused Numba kernel and skip torch's per-op dispatch;
+    #    otherwise build the full query x comment similarity matrix in one matmul
+    top_k_cosine = get_top_k_kernel() if embs.device.type == "cpu" else None
+    use_numba = top_k_cosine is not None
+    if use_numba:
+        q_np = np.ascontiguousarray(q_embs.numpy(), dtype=np.float32)
+        c_np = np.ascontiguousarray(c_embs.numpy(), dtype=np.float32)
+    else:
+        sims_all = q_embs @ c_embs.T
+
+    # 3) Per video: gather its columns and take the top-k (O(N log k), no full sort)
+    ranked: Dict[str, List[List[str]]] = {}
+    for vid, comments in comments_by_video.items():
+        comments = list(dict.fromkeys(comments))  # repeated comments would fill several top-k slots
+        if not comments:
+            ranked[vid] = [[] for _ in queries]
+            continue
+        k = min(max_comments, len(comments))
+        if use_numba:
+            cols = np.fromiter((unique[c] for c in comments), dtype=np.int64, count=len(comments))
+            top, vals = top_k_cosine(q_np, c_np, cols, k)
+            keep = (vals >= min_similarity).tolist()
+        else:
+            idx = torch.tensor([unique[c] for c in comments], device=sims_all.device)
+            vals, top = torch.topk(sims_all.index_select(1, idx), k=k, dim=1)
+            keep = (vals >= min_similarity).tolist()
+        top = top.tolist()
+        ranked[vid] = [
+            [comments[j] for j, ok in zip(row, mask) if ok]
+            for row, mask in zip(top, keep)
+        ]
+    return ranked
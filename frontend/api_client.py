@@ -0,0 +1,192 @@
+# frontend/api_client.py
+
+import gzip
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import diskcache
+import orjson
+import pandas as pd
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+
+API_BASE = os.getenv("API_BASE_URL", "http://localhost:8000")
+GZIP_MIN_BYTES = 1024  # smaller bodies are not worth compressing
+CACHE_TTL = 60 * 60    # seconds LLM/YouTube responses stay cached for identical inputs
+SEARCH_WORKERS = 8     # concurrent /youtube_search calls
+
+# Ranked comments survive restarts and are shared by every user of this frontend
+COMMENTS_CACHE_DIR = os.getenv("COMMENTS_CACHE_DIR", ".cache/comments")
+COMMENTS_CACHE_TTL = 24 * 60 * 60  # seconds
+
+
+@st.cache_resource
+def get_session() -> requests.Session:
+    """One keep-alive connection pool to the API, shared across reruns and sessions."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=10, pool_maxsize=10)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+SESSION = get_session()
+
+
+def json_body(body: bytes, compress: bool = True):
+    """Body and headers for posting JSON bytes, gzip-compressed once large enough to pay off."""
+    headers = {"Content-Type": "application/json"}
+    if compress and len(body) > GZIP_MIN_BYTES:
+        body = gzip.compress(body, compresslevel=5)
+        headers["Content-Encoding"] = "gzip"
+    return body, headers
+
+
+def decode(resp: requests.Response):
+    """
+    Parse a JSON response with orjson. A non-JSON body (e.g. a proxy error page) raises
+    requests' JSONDecodeError, a RequestException, just like resp.json() would.
+    """
+    try:
+        return orjson.loads(resp.content)
+    except orjson.JSONDecodeError as e:
+        raise requests.exceptions.JSONDecodeError(e.msg, e.doc, e.pos, response=resp) from e
+
+
+def post(path: str, payload, timeout: float, compress: bool = False):
+    """POST `payload` as JSON to the API and return the decoded response; raises on HTTP errors."""
+    body, headers = json_body(orjson.dumps(payload), compress)
+    resp = SESSION.post(f"{API_BASE}{path}", data=body, headers=headers, timeout=timeout)
+    resp.raise_for_status()
+    return decode(resp)
+
+
+@st.cache_data(show_spinner=False)
+def process_profiles(digest: str, _df: pd.DataFrame) -> list:
+    """
+    Personas for an uploaded profile table, cached on `digest` (a hash of the uploaded file).
+    The frame itself is not hashed: Streamlit only samples rows of large frames.
+    """
+    # pandas' C serializer writes the records straight to JSON, skipping one dict per row
+    body, headers = json_body(b'{"profiles":' + _df.to_json(orient="records").encode() + b'}')
+    resp = SESSION.post(f"{API_BASE}/process_profiles", data=body, headers=headers, timeout=120)
+    resp.raise_for_status()
+    return decode(resp).get("personas", [])
+
+
+def extract_business_info(website_url: str, max_pages: int, max_workers: int) -> dict:
+    return post(
+        "/extract_business_info",
+        {"website_url": website_url, "max_pages": max_pages, "max_workers": max_workers},
+        timeout=120,
+    )
+
+
+def summarize_business(business: dict) -> dict:
+    return post("/summarize_business", {"business": business}, timeout=60)
+
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def summarize_profile(profile: dict) -> str:
+    return post("/summarize_profile", profile, timeout=30).get("summary", "")
+
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def generate_followup_queries(summary: str, topic: str, competitors: tuple) -> list:
+    return post(
+        "/generate_followup_queries",
+        {"summary": summary, "topic": topic, "competitors": list(competitors)},
+        timeout=30,
+    ).get("questions", [])
+
+
+def youtube_search(query: str, order: str = "viewCount", max_results: int = 5) -> list:
+    return post(
+        "/youtube_search",
+        {"query": query, "order": order, "max_results": max_results},
+        timeout=60,
+    ).get("videos", [])
+
+
+@st.cache_resource
+def get_executor() -> ThreadPoolExecutor:
+    """Worker threads for concurrent API calls, kept alive across reruns."""
+    return ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="api")
+
+
+class _PartialSearch(Exception):
+    """Raised out of the cached search so results containing failures are not cached."""
+
+    def __init__(self, results: list):
+        super().__init__("some competitor searches failed")
+        self.results = results
+
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def _search_all(comps: tuple) -> list:
+    # Workers only make plain HTTP calls: they have no ScriptRunContext, so no st.* in them.
+    # The sockets wait concurrently (the GIL is released).
+    futures = [get_executor().submit(youtube_search, c) for c in comps]
+    results = []
+    for future in futures:
+        try:
+            results.append(future.result())
+        except Exception as e:
+            results.append(e)
+    if any(isinstance(r, Exception) for r in results):
+        raise _PartialSearch(results)
+    return results
+
+
+def search_competitor_videos(comps: list) -> list:
+    """Top videos per competitor, in `comps` order; a failed search yields its exception instead."""
+    try:
+        return _search_all(tuple(comps))
+    except _PartialSearch as e:
+        return e.results
+
+
+def submit_youtube_comments_job(video_ids: list, questions: list) -> str:
+    """Queue /youtube_comments_filtered work on the API; poll get_job() with the returned ID."""
+    return post(
+        "/youtube_comments_filtered/jobs",
+        {"video_ids": video_ids, "questions": questions},
+        timeout=30,
+        compress=True,
+    )["job_id"]
+
+
+@st.cache_resource
+def get_comments_cache() -> diskcache.Cache:
+    return diskcache.Cache(COMMENTS_CACHE_DIR, size_limit=2**28)
+
+
+def comments_key(video_ids: list, questions: list) -> tuple:
+    return tuple(video_ids), tuple(questions)
+
+
+def cached_comments(key: tuple) -> Optional[dict]:
+    """Previously ranked comments for (video_ids, questions), or None on a miss."""
+    return get_comments_cache().get(key)
+
+
+def store_comments(key: tuple, comments: dict) -> None:
+    """
+    Persist ranked comments. Results with an empty video are skipped: the API reports
+    YouTube failures (quota, 5xx) as empty lists, and those must not stick for a day.
+    """
+    if comments and all(comments.values()):
+        get_comments_cache().set(key, comments, expire=COMMENTS_CACHE_TTL)
+
+
+def get_job(job_id: str) -> dict:
+    """Current {status, result, error} of a background job."""
+    resp = SESSION.get(f"{API_BASE}/jobs/{job_id}", timeout=10)
+    resp.raise_for_status()
+    return decode(resp)
+
+
+def comment_personas(video_comments: dict) -> list:
+    return post("/comment_personas", video_comments, timeout=60).get("personas", [])
@@ -1,10 +1,130 @@
 import streamlit as st
 import pandas as pd
-import requests
 import os
+import requests
+import xxhash
+
+import api_client as api
 
-API_BASE = os.getenv("API_BASE_URL", "http://localhost:8000")
 st.set_page_config(page_title="Business Toolkit", layout="wide")
+# Every column is embedded into the profile text, so all are read by default; set
+# PROFILE_COLUMNS (comma-separated) to parse only those plus `customer_id`.
+PROFILE_COLUMNS = {c.strip() for c in os.getenv("PROFILE_COLUMNS", "").split(",") if c.strip()}
+USECOLS = (lambda c: c == "customer_id" or c in PROFILE_COLUMNS) if PROFILE_COLUMNS else None
+
+
+def fill_missing(df: pd.DataFrame) -> pd.DataFrame:
+    """Blank out missing text and use column medians for missing numbers, touching only columns with gaps."""
+    gaps = df.columns[df.isna().any()]
+    if gaps.empty:
+        return df
+    fill = dict.fromkeys(df[gaps].select_dtypes(exclude="number").columns, "")
+    fill.update(df[gaps].select_dtypes("number").median().to_dict())
+    return df.fillna(fill)
+
+
+@st.cache_data(show_spinner=False)
+def personas_frame(personas: list) -> pd.DataFrame:
+    """Flatten persona JSON into one table: nested objects become dotted columns, lists become text."""
+    df = pd.json_normalize(personas)
+    return df.map(lambda v: ", ".join(map(str, v)) if isinstance(v, list) else v).astype("string")
+
+
+@st.fragment(run_every=2)
+def poll_comments_job():
+    """Check the background comment fetch without blocking the page; reruns the app once it finishes."""
+    if not st.session_state.comments_job:
+        return
+    try:
+        job = api.get_job(st.session_state.comments_job)
+    except requests.exceptions.HTTPError as e:
+        if e.response is None or e.response.status_code != 404:
+            st.warning(f"Retrying comment status check: {e}")
+            return
+        # Unknown job (e.g. the API restarted): it will never finish
+        st.session_state.comments_job = None
+        st.session_state.comments_error = "The comment fetch job was lost; please fetch again."
+        st.rerun()
+    except requests.exceptions.RequestException as e:
+        # Transient network error: keep the job ID and try again on the next tick
+        st.warning(f"Retrying comment status check: {e}")
+        return
+    if job["status"] in ("pending", "running"):
+        st.info("⏳ Fetching and ranking comments…")
+        return
+    st.session_state.comments_job = None
+    if job["status"] == "done":
+        st.session_state.video_comments = job["result"]
+        api.store_comments(st.session_state.comments_key, job["result"])
+    else:
+        st.session_state.comments_error = job["error"]
+    st.rerun()
+
+
+@st.fragment
+def competitor_pipeline():
+    """Competitor insight steps 1-4; their buttons rerun only this fragment, not the whole page."""
+    st.subheader("Profile Summary"); st.write(st.session_state.business_summary)
+    # Competitor questions
+    if st.button("1. Generate Competitor Questions"):
+        try:
+            st.session_state.followup_questions = api.generate_followup_queries(
+                st.session_state.business_summary, "competitors",
+                tuple(st.session_state.business_profile.get("competitors", [])))
+        except requests.exceptions.RequestException as e:
+            st.error(f"Error generating questions: {e}")
+    if st.session_state.followup_questions:
+        st.markdown("**Competitor Follow-Up Questions:**")
+        for i, q in enumerate(st.session_state.followup_questions,1): st.write(f"{i}. {q}")
+        # Fetch videos
+        if st.button("2. Fetch Competitor Videos"):
+            vids_map = {}
+            comps = st.session_state.business_profile.get("competitors",[])
+            for comp, res in zip(comps, api.search_competitor_videos(comps)):
+                if isinstance(res, Exception):
+                    st.error(f"Error fetching videos for {comp}: {res}")
+                else:
+                    vids_map[comp]=res
+            st.session_state.competitor_videos = vids_map
+        # Display videos
+        if st.session_state.competitor_videos:
+            st.subheader("Competitor Videos (Top 5 by Views)")
+            for comp, vids in st.session_state.competitor_videos.items():
+                st.markdown(f"**{comp}**")
+                for v in vids: st.write(f"- [{v['title']}]({v['url']}) — {v['viewCount']} views")
+        # Fetch comments
+        if st.button("3. Fetch Video Comments"):
+            all_ids=[vid['id'] for vids in st.session_state.competitor_videos.values() for vid in vids]
+            st.session_state.comments_error = None
+            key = api.comments_key(all_ids, st.session_state.followup_questions)
+            cached = api.cached_comments(key)
+            if cached is not None:
+                st.session_state.video_comments = cached
+            else:
+                try:
+                    st.session_state.comments_job = api.submit_youtube_comments_job(all_ids, st.session_state.followup_questions)
+                    st.session_state.comments_key = key
+                    st.rerun()  # full rerun so the poller outside this fragment starts
+                except requests.exceptions.RequestException as e:
+                    st.error(f"Error fetching filtered comments: {e}")
+        if st.session_state.comments_error:
+            st.error(f"Error fetching filtered comments: {st.session_state.comments_error}")
+        # Display comments
+        if st.session_state.video_comments:
+            st.subheader("Top Semantically Relevant Comments")
+            for vid, comms in st.session_state.video_comments.items():
+                st.write(f"**Video {vid}:**")
+                for c in comms: st.write(f"- {c}")
+        # Generate personas
+        if st.button("4. Generate Customer Personas"):
+            try:
+                st.session_state.comment_personas = api.comment_personas(st.session_state.video_comments)
+            except requests.exceptions.RequestException as e:
+                st.error(f"Error generating customer personas: {e}")
+        if st.session_state.comment_personas:
+            st.subheader("Customer Personas from Competitor Insights")
+            st.dataframe(personas_frame(st.session_state.comment_personas), use_container_width=True)
+
 
 # Sidebar
 st.sidebar.title("Tools")
@@ -14,17 +134,20 @@ page = st.sidebar.radio("Choose a tool", ["Existing Customer", "New Customer"])
 initial_state = {
     "personas_df": None,
     "personas": [],
+    "upload_hash": None,
     "business_profile": None,
     "business_summary": "",
     "followup_questions": [],
     "competitor_videos": {},
     "video_comments": {},
+    "comments_job": None,
+    "comments_key": None,
+    "comments_error": None,
     "comment_personas": [],
     "biz_defaults": {}
 }
 for key, val in initial_state.items():
-    if key not in st.session_state:
-        st.session_state[key] = val
+    st.session_state.setdefault(key, val)
 
 # ---------------- Existing Customer ----------------
 if page == "Existing Customer":
@@ -36,7 +159,7 @@ if page == "Existing Customer":
         generate_clicked = st.button("Generate Personas")
     with col2:
         if st.button("Reset Data"):
-            for k in ["personas_df", "personas"]:
+            for k in ["personas_df", "personas", "upload_hash"]:
                 st.session_state[k] = initial_state[k]
             st.rerun()
 
@@ -45,24 +168,25 @@ if page == "Existing Customer":
             st.warning("Please upload a CSV file.")
             st.stop()
 
-        df = pd.read_csv(uploaded)
-        if "customer_id" not in df.columns:
-            st.error("CSV missing required column: `customer_id`.")
-            st.stop()
+        # Byte-identical re-uploads keep their personas instead of re-running the pipeline
+        digest = xxhash.xxh3_64_hexdigest(uploaded.getbuffer())  # hashes in place, no copy
+        if digest == st.session_state.upload_hash:
+            st.info("This file was already processed; showing its personas.")
+        else:
+            # One post for the whole file: clustering (and the fill medians) must see every row
+            df = pd.read_csv(uploaded, usecols=USECOLS)
+            if "customer_id" not in df.columns:
+                st.error("CSV missing required column: `customer_id`.")
+                st.stop()
 
-        df = df.fillna({col: "" if df[col].dtype == object else df[col].median() for col in df.columns})
-        st.session_state.personas_df = df
+            df = fill_missing(df)
+            st.session_state.personas_df = df.head()
 
-        try:
-            resp = requests.post(
-                f"{API_BASE}/process_profiles",
-                json={"profiles": df.to_dict(orient="records")},
-                timeout=120
-            )
-            resp.raise_for_status()
-            st.session_state.personas = resp.json().get("personas", [])
-        except requests.exceptions.RequestException as e:
-            st.error(f"API Error: {e}")
+            try:
+                st.session_state.personas = api.process_profiles(digest, df)
+                st.session_state.upload_hash = digest
+            except requests.exceptions.RequestException as e:
+                st.error(f"API Error: {e}")
 
     if st.session_state.personas_df is not None:
         st.subheader("Data Sample")
@@ -70,8 +194,7 @@ if page == "Existing Customer":
 
     if st.session_state.personas:
         st.success("Personas Generated")
-        for persona in st.session_state.personas:
-            st.json(persona)
+        st.dataframe(personas_frame(st.session_state.personas), use_container_width=True)
 
 # ---------------- New Customer ----------------
 else:
@@ -85,13 +208,7 @@ else:
         max_workers = st.number_input("Number of workers (threads)", min_value=1, max_value=10, value=2)
         if st.button("Fetch data from site"):
             try:
-                resp = requests.post(
-                    f"{API_BASE}/extract_business_info",
-                    json={"website_url": website_url, "max_pages": max_pages, "max_workers": max_workers},
-                    timeout=120
-                )
-                resp.raise_for_status()
-                st.session_state.biz_defaults = resp.json()
+                st.session_state.biz_defaults = api.extract_business_info(website_url, max_pages, max_workers)
                 st.success("Auto-fill data loaded. You can tweak the fields below.")
             except requests.exceptions.RequestException as e:
                 st.error(f"Error fetching auto-fill data: {e}")
@@ -110,7 +227,8 @@ else:
         "goals": "; ".join(raw.get("goals", []))
     }
     ui_channel_options = ["Email", "Social Media", "Events", "SEO", "Partnerships", "Paid Ads"]
-    defaults["channels"] = [opt for opt in ui_channel_options if opt.lower() in [c.lower() for c in raw.get("channels", [])]]
+    raw_channels = {c.lower() for c in raw.get("channels", [])}
+    defaults["channels"] = [opt for opt in ui_channel_options if opt.lower() in raw_channels]
 
     # Business profile form
     with st.form("biz_form"):
@@ -144,77 +262,16 @@ else:
                        "competitors": competitors, "channels": channels,
                        "goals": goals.split(";")}
         try:
-            resp = requests.post(f"{API_BASE}/summarize_business", json={"business": biz_payload}, timeout=60)
-            resp.raise_for_status(); st.session_state.business_profile = resp.json()
+            st.session_state.business_profile = api.summarize_business(biz_payload)
         except requests.exceptions.RequestException as e:
             st.error(f"API Error: {e}"); st.stop()
         try:
-            summ = requests.post(f"{API_BASE}/summarize_profile", json=st.session_state.business_profile, timeout=30)
-            summ.raise_for_status(); st.session_state.business_summary = summ.json().get("summary", "")
+            st.session_state.business_summary = api.summarize_profile(st.session_state.business_profile)
         except requests.exceptions.RequestException as e:
             st.error(f"Summary API error: {e}")
 
     # Competitor insights
     if st.session_state.business_summary:
-        st.subheader("Profile Summary"); st.write(st.session_state.business_summary)
-        # Competitor questions
-        if st.button("1. Generate Competitor Questions"):
-            try:
-                r = requests.post(f"{API_BASE}/generate_followup_queries",
-                                   json={"summary": st.session_state.business_summary,
-                                         "topic": "competitors",
-                                         "competitors": st.session_state.business_profile.get("competitors", [])}, timeout=30)
-                r.raise_for_status(); st.session_state.followup_questions = r.json().get("questions", [])
-            except requests.exceptions.RequestException as e:
-                st.error(f"Error generating questions: {e}")
-        if st.session_state.followup_questions:
-            st.markdown("**Competitor Follow-Up Questions:**")
-            for i, q in enumerate(st.session_state.followup_questions,1): st.write(f"{i}. {q}")
-            # Fetch videos
-            if st.button("2. Fetch Competitor Videos"):
-                vids_map = {}
-                for comp in st.session_state.business_profile.get("competitors",[]):
-                    try:
-                        r_v = requests.post(f"{API_BASE}/youtube_search",
-                                            json={"query":comp,"order":"viewCount","max_results":5},timeout=60)
-                        r_v.raise_for_status(); vids_map[comp]=r_v.json().get("videos",[])
-                    except requests.exceptions.RequestException as e:
-                        st.error(f"Error fetching videos for {comp}: {e}")
-                st.session_state.competitor_videos = vids_map
-            # Display videos
-            if st.session_state.competitor_videos:
-                st.subheader("Competitor Videos (Top 5 by Views)")
-                for comp, vids in st.session_state.competitor_videos.items():
-                    st.markdown(f"**{comp}**")
-                    for v in vids: st.write(f"- [{v['title']}]({v['url']}) — {v['viewCount']} views")
-            # Fetch comments
-            if st.button("3. Fetch Video Comments"):
-                all_ids=[vid['id'] for vids in st.session_state.competitor_videos.values() for vid in vids]
-                try:
-                    r_c= requests.post(f"{API_BASE}/youtube_comments_filtered",
-                                       json={"video_ids":all_ids,"questions":st.session_state.followup_questions},timeout=120)
-                    r_c.raise_for_status(); st.session_state.video_comments = r_c.json()
-                except requests.exceptions.Timeout:
-                    st.error("🕒 Fetching comments timed out. Try again.")
-                except requests.exceptions.RequestException as e:
-                    st.error(f"Error fetching filtered comments: {e}")
-            # Display comments
-            if st.session_state.video_comments:
-                st.subheader("Top Semantically Relevant Comments")
-                for vid, comms in st.session_state.video_comments.items():
-                    st.write(f"**Video {vid}:**")
-                    for c in comms: st.write(f"- {c}")
-            # Generate personas
-            if st.button("4. Generate Customer Personas"):
-                try:
-                    r_p = requests.post(
-                        f"{API_BASE}/comment_personas",
-                        json=st.session_state.video_comments,
-                        timeout=60
-                    )
-                    r_p.raise_for_status(); st.session_state.comment_personas = r_p.json().get("personas", [])
-                except requests.exceptions.RequestException as e:
-                    st.error(f"Error generating customer personas: {e}")
-            if st.session_state.comment_personas:
-                st.subheader("Customer Personas from Competitor Insights")
-                for persona in st.session_state.comment_personas: st.json(persona)
+        competitor_pipeline()
+        if st.session_state.comments_job:
+            poll_comments_job()
@@ -0,0 +1,83 @@
+import asyncio
+import gzip
+
+import orjson
+import pytest
+
+pytest.importorskip("fastapi")
+
+from backend import gzip_request
+from backend.gzip_request import GzipRequestMiddleware
+
+
+def _call(body: bytes, headers, chunk_size: int = 64):
+    """Run one request through the middleware; return (body seen by the app, its headers, response)."""
+    seen = {}
+
+    async def app(scope, receive, send):
+        parts = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            parts.append(message.get("body", b""))
+            more_body = message.get("more_body", False)
+        seen["body"] = b"".join(parts)
+        seen["headers"] = dict(scope["headers"])
+
+    chunks = [body[i : i + chunk_size] for i in range(0, len(body), chunk_size)] or [b""]
+    messages = [
+        {"type": "http.request", "body": c, "more_body": i < len(chunks) - 1}
+        for i, c in enumerate(chunks)
+    ]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": "/", "headers": headers}
+    asyncio.run(GzipRequestMiddleware(app)(scope, receive, send))
+    return seen.get("body"), seen.get("headers"), sent
+
+
+def _status(sent) -> int:
+    return next(m["status"] for m in sent if m["type"] == "http.response.start")
+
+
+def test_gzip_body_is_inflated():
+    payload = orjson.dumps({"profiles": [{"text": "hello world"}] * 50})
+    body = gzip.compress(payload)
+    headers = [
+        (b"content-type", b"application/json"),
+        (b"content-encoding", b"gzip"),
+        (b"content-length", str(len(body)).encode()),
+    ]
+    seen_body, seen_headers, sent = _call(body, headers)
+    assert seen_body == payload
+    assert b"content-encoding" not in seen_headers
+    assert seen_headers[b"content-length"] == str(len(payload)).encode()
+    assert sent == []
+
+
+def test_plain_body_passes_through():
+    payload = b'{"a": 1}'
+    headers = [(b"content-type", b"application/json")]
+    seen_body, seen_headers, _ = _call(payload, headers)
+    assert seen_body == payload
+    assert seen_headers == dict(headers)
+
+
+def test_oversized_body_is_rejected(monkeypatch):
+    monkeypatch.setattr(gzip_request, "MAX_INFLATED_BYTES", 1024)
+    body = gzip.compress(b"x" * 4096)
+    seen_body, _, sent = _call(body, [(b"content-encoding", b"gzip")])
+    assert seen_body is None
+    assert _status(sent) == 413
+
+
+def test_invalid_gzip_is_rejected():
+    seen_body, _, sent = _call(b"not gzip at all", [(b"content-encoding", b"gzip")])
+    assert seen_body is None
+    assert _status(sent) == 400
@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+from fastapi import HTTPException
+
+from backend import jobs
+
+
+def test_job_runs_pending_to_done():
+    async def scenario():
+        release = asyncio.Event()
+
+        async def work():
+            await release.wait()
+            return {"ok": True}
+
+        job_id = jobs.submit(work())
+        assert (await jobs.get_job(job_id))["status"] == "pending"
+        await asyncio.sleep(0)
+        assert (await jobs.get_job(job_id))["status"] == "running"
+        release.set()
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        return await jobs.get_job(job_id)
+
+    job = asyncio.run(scenario())
+    assert job["status"] == "done"
+    assert job["result"] == {"ok": True}
+    assert job["error"] is None
+
+
+@pytest.mark.parametrize(
+    "exc, error",
+    [(HTTPException(status_code=500, detail="groq down"), "groq down"), (ValueError("boom"), "boom")],
+)
+def test_job_failure_records_error(exc, error):
+    async def scenario():
+        async def work():
+            raise exc
+
+        job_id = jobs.submit(work())
+        while (await jobs.get_job(job_id))["status"] in ("pending", "running"):
+            await asyncio.sleep(0)
+        return job_id, await jobs.get_job(job_id)
+
+    job_id, job = asyncio.run(scenario())
+    assert job["status"] == "failed"
+    assert job["error"] == error
+    assert job["result"] is None
+    assert jobs._jobs[job_id]["finished"] is not None
+
+
+def test_unknown_job_is_404():
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(jobs.get_job("missing"))
+    assert e.value.status_code == 404
+
+
+def test_finished_jobs_are_pruned_after_ttl(monkeypatch):
+    jobs._jobs["old"] = {"status": "done", "result": 1, "error": None, "finished": 1.0}
+    jobs._jobs["live"] = {"status": "running", "result": None, "error": None, "finished": None}
+    monkeypatch.setattr(jobs.time, "time", lambda: 1.0 + jobs.JOB_TTL + 1)
+    jobs._prune()
+    assert "old" not in jobs._jobs
+    assert "live" in jobs._jobs
+    del jobs._jobs["live"]
@@ -0,0 +1,27 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+torch = pytest.importorskip("torch")
+pytest.importorskip("numba")
+
+from backend.topk_kernel import top_k_cosine
+
+
+def _unit_rows(rng, n: int, dim: int) -> np.ndarray:
+    m = rng.standard_normal((n, dim)).astype(np.float32)
+    return m / np.linalg.norm(m, axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize("k", [1, 3, 5])
+def test_numba_top_k_matches_torch(k):
+    rng = np.random.default_rng(0)
+    q = _unit_rows(rng, 4, 32)
+    c = _unit_rows(rng, 40, 32)
+    cols = np.array([3, 7, 8, 15, 16, 22, 23, 31, 39], dtype=np.int64)
+
+    top_i, top_v = top_k_cosine(q, c, cols, k)
+
+    sims = torch.from_numpy(q) @ torch.from_numpy(c).T
+    ref_v, ref_i = torch.topk(sims.index_select(1, torch.from_numpy(cols)), k=k, dim=1)
+    np.testing.assert_array_equal(top_i, ref_i.numpy())
+    np.testing.assert_allclose(top_v, ref_v.numpy(), rtol=1e-5, atol=1e-5)